@@ -1,19 +1,90 @@
 import os
+import threading
 from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Sequence, Tuple
 
+from sqlalchemy import delete, event, insert, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.exc import OperationalError
 from sqlmodel import Session
 from sqlmodel import SQLModel, create_engine
 
+from backend.app.models import Chunk, ChunkEmbedding, StaleVector
+from backend.app.services.chunk_search import ensure_chunk_fts, fts_enabled, unindex_chunks
+
+# Chunk ids per statement when retiring chunks; SQLite caps bound parameters.
+RETIRE_BATCH = 500
+
+
+# SQLite tuning applied on every new DBAPI connection. WAL lets the polling
+# frontend read while pipeline jobs write; busy_timeout makes writers wait for
+# the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS: Dict[str, str] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    # Negative cache_size is in KiB rather than pages.
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+    "temp_store": "MEMORY",
+}
+
+_engines: Dict[Tuple[str, bool], Engine] = {}
+_engines_lock = threading.Lock()
+
 
 def get_database_url() -> str:
     return os.getenv("DATABASE_URL", "sqlite:///./paper_agent.db")
 
 
-def create_db_engine(echo: bool = False):
-    database_url = get_database_url()
-    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
-    return create_engine(database_url, echo=echo, connect_args=connect_args)
+def _apply_sqlite_pragmas(dbapi_conn, _record) -> None:
+    cursor = dbapi_conn.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _build_engine(database_url: str, echo: bool) -> Engine:
+    if not database_url.startswith("sqlite"):
+        return create_engine(database_url, echo=echo, pool_pre_ping=True)
+    engine = create_engine(
+        database_url,
+        echo=echo,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+
+def create_db_engine(echo: bool = False) -> Engine:
+    """Return the process-wide engine for the configured DATABASE_URL.
+
+    Engines are cached per (url, echo) so routers, scripts and pipeline jobs
+    share one connection pool instead of building a new one per call.
+    """
+    key = (get_database_url(), echo)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _build_engine(key[0], echo)
+            _engines[key] = engine
+    return engine
+
+
+def dispose_engines() -> None:
+    """Dispose and forget all cached engines (tests, shutdown, URL changes)."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
 
 
 def get_session(engine=None) -> Session:
@@ -22,6 +93,12 @@ def get_session(engine=None) -> Session:
     return Session(engine)
 
 
+def get_db_session():
+    """FastAPI dependency yielding a session bound to the shared engine."""
+    with get_session() as session:
+        yield session
+
+
 @contextmanager
 def session_scope(engine=None):
     session = get_session(engine)
@@ -35,10 +112,127 @@ def session_scope(engine=None):
         session.close()
 
 
+def _stale_vector_insert_stmt(conn: Connection):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        return sqlite_insert(StaleVector).on_conflict_do_nothing(index_elements=["vector_id", "collection"])
+    if dialect == "postgresql":
+        return pg_insert(StaleVector).on_conflict_do_nothing(index_elements=["vector_id", "collection"])
+    return insert(StaleVector)
+
+
+def retire_chunk_ids(conn: Connection, chunk_ids: Sequence[int]) -> None:
+    """Delete chunks by id, dropping their FTS rows and queueing their vectors for removal.
+
+    The embedding ledger knows which collections hold each vector; a StaleVector
+    row is queued per (chunk, collection) and purged by the next embed job.
+    """
+    fts = fts_enabled(conn)
+    now = datetime.utcnow()
+    for start in range(0, len(chunk_ids), RETIRE_BATCH):
+        batch = list(chunk_ids[start : start + RETIRE_BATCH])
+        embedded = conn.execute(
+            select(ChunkEmbedding.chunk_id, ChunkEmbedding.collection).where(ChunkEmbedding.chunk_id.in_(batch))
+        ).all()
+        if embedded:
+            conn.execute(
+                _stale_vector_insert_stmt(conn),
+                [
+                    {"vector_id": f"chunk-{cid}", "chunk_id": cid, "collection": collection, "created_at": now}
+                    for cid, collection in embedded
+                ],
+            )
+        conn.execute(delete(ChunkEmbedding).where(ChunkEmbedding.chunk_id.in_(batch)))
+        if fts:
+            unindex_chunks(conn, batch)
+        conn.execute(delete(Chunk).where(Chunk.id.in_(batch)))
+
+
+def _ensure_unique_chunk_hash(engine: Engine) -> None:
+    """Upgrade databases created before chunk.hash became unique.
+
+    Duplicate rows (all but the lowest id per hash) are retired like re-chunked
+    ones, so their vectors and FTS rows do not outlive them.
+    """
+    indexes = inspect(engine).get_indexes("chunk")
+    if any(ix["column_names"] == ["hash"] and ix["unique"] for ix in indexes):
+        return
+    with engine.begin() as conn:
+        duplicates = conn.execute(
+            text("SELECT id FROM chunk WHERE id NOT IN (SELECT MIN(id) FROM chunk GROUP BY hash)")
+        ).scalars().all()
+        retire_chunk_ids(conn, duplicates)
+        for ix in indexes:
+            if ix["column_names"] == ["hash"]:
+                conn.execute(text(f"DROP INDEX {ix['name']}"))
+        conn.execute(text("CREATE UNIQUE INDEX ix_chunk_hash ON chunk (hash)"))
+    if duplicates:
+        print(
+            f"[WARN] Removed {len(duplicates)} duplicate chunks while making chunk.hash unique; "
+            "their vectors are queued for purging"
+        )
+
+
+def _ensure_columns(engine: Engine, table: str, columns: Dict[str, str]) -> None:
+    """Add nullable columns that were introduced after the table was first created."""
+    existing = {col["name"] for col in inspect(engine).get_columns(table)}
+    missing = {name: ddl for name, ddl in columns.items() if name not in existing}
+    if not missing:
+        return
+    with engine.begin() as conn:
+        for name, ddl in missing.items():
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _ensure_stale_vector_collection(engine: Engine) -> None:
+    """Upgrade the stale-vector queue to one row per (vector, collection).
+
+    Rows from before the upgrade do not say which collections held the vector,
+    so they are queued for every collection in the embedding ledger; deleting an
+    id a collection never had is harmless.
+    """
+    inspector = inspect(engine)
+    if "collection" in {col["name"] for col in inspector.get_columns("stalevector")}:
+        return
+    indexes = [ix["name"] for ix in inspector.get_indexes("stalevector")]
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE stalevector RENAME TO stalevector_old"))
+        for name in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+        StaleVector.__table__.create(conn)
+        conn.execute(
+            text(
+                "INSERT INTO stalevector (vector_id, chunk_id, collection, created_at) "
+                "SELECT s.vector_id, s.chunk_id, c.collection, s.created_at FROM stalevector_old s "
+                "CROSS JOIN (SELECT DISTINCT collection FROM chunkembedding) c"
+            )
+        )
+        conn.execute(text("DROP TABLE stalevector_old"))
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """Apply in-place upgrades that create_all cannot express for existing tables."""
+    # The stale-vector queue must have its collection column before duplicate chunks are retired into it.
+    _ensure_stale_vector_collection(engine)
+    _ensure_unique_chunk_hash(engine)
+    _ensure_columns(
+        engine,
+        "fileattachment",
+        {
+            "fingerprint_size": "INTEGER",
+            "fingerprint_mtime": "FLOAT",
+            "fingerprint_sha256": "VARCHAR",
+            "chunked_at": "DATETIME",
+        },
+    )
+    ensure_chunk_fts(engine)
+
+
 def init_db(engine=None) -> None:
     if engine is None:
         engine = create_db_engine()
     try:
         SQLModel.metadata.create_all(engine)
+        upgrade_schema(engine)
     except OperationalError as exc:
         raise RuntimeError(f"Failed to initialize database: {exc}") from exc
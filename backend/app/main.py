@@ -1,8 +1,12 @@
+import threading
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .db import create_db_engine, init_db
+from .db import create_db_engine, get_session, init_db
 from .routers import papers, config, chat, import_csv, pipeline
+from .services.model_client import aclose_clients, configure_http
+from .services.vector_store import warm_vector_store
 
 
 def create_app() -> FastAPI:
@@ -26,6 +30,18 @@ def create_app() -> FastAPI:
     app.include_router(import_csv.router)
     app.include_router(pipeline.router)
 
+    @app.on_event("startup")
+    def load_runtime_settings():
+        with get_session() as session:
+            cfg = config.read_config(session)
+        configure_http(cfg)
+        # Opening the vector store can take seconds; do it off the startup path.
+        threading.Thread(target=warm_vector_store, args=(cfg,), daemon=True).start()
+
+    @app.on_event("shutdown")
+    async def close_http_clients():
+        await aclose_clients()
+
     return app
 
 
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 
@@ -31,6 +32,11 @@ class FileAttachment(SQLModel, table=True):
     paper_id: Optional[int] = Field(default=None, foreign_key="paper.id", index=True)
     path: str
     attachment_type: Optional[str] = Field(default=None, index=True)
+    # Fingerprint of the file as last chunked; a mismatch triggers re-chunking.
+    fingerprint_size: Optional[int] = Field(default=None)
+    fingerprint_mtime: Optional[float] = Field(default=None)
+    fingerprint_sha256: Optional[str] = Field(default=None)
+    chunked_at: Optional[datetime] = Field(default=None)
 
 
 class Chunk(SQLModel, table=True):
@@ -38,7 +44,7 @@ class Chunk(SQLModel, table=True):
     paper_id: int = Field(foreign_key="paper.id", index=True)
     source_path: Optional[str] = Field(default=None, index=True)
     seq: int = Field(index=True)
-    hash: str = Field(index=True)
+    hash: str = Field(index=True, unique=True)
     content: str
     text_length: int = Field(default=0)
     created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -67,3 +73,77 @@ class Tag(SQLModel, table=True):
     tag_type: str = Field(index=True)  # e.g., domain/task/keyword
     value: str = Field(index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class QuarantinedFile(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    path: str = Field(index=True, unique=True)
+    reason: str = Field(index=True)  # e.g., timeout/page_timeout/memory/crashed/error
+    detail: Optional[str] = Field(default=None)
+    file_size: Optional[int] = Field(default=None)
+    file_mtime: Optional[float] = Field(default=None)
+    attempts: int = Field(default=1)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class StaleVector(SQLModel, table=True):
+    # One row per retired vector and collection still holding it; purged per collection.
+    __table_args__ = (UniqueConstraint("vector_id", "collection"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    vector_id: str = Field(index=True)  # e.g., chunk-<id>
+    chunk_id: int = Field(index=True)
+    collection: str = Field(index=True)  # ChunkEmbedding.collection (the store's ledger name)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class ChunkEmbedding(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("chunk_id", "model", "collection"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chunk_id: int = Field(index=True)
+    model: str = Field(index=True)
+    collection: str = Field(index=True)
+    content_hash: str  # Chunk.hash at embedding time; guards against reused chunk ids
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class PaperEmbedding(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("paper_id", "model", "collection"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    paper_id: int = Field(index=True)
+    model: str = Field(index=True)
+    collection: str = Field(index=True)
+    content_hash: str  # SHA-256 of the title/abstract/summary text that was embedded
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class GroupDigest(SQLModel, table=True):
+    # Condensed text of a group of consecutive chunks, reused across map-reduce chats.
+    __table_args__ = (UniqueConstraint("group_hash", "model"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    paper_id: int = Field(foreign_key="paper.id", index=True)
+    model: str = Field(index=True)
+    group_hash: str = Field(index=True)  # SHA-256 of the group text and condense prompt
+    first_seq: int
+    last_seq: int
+    digest: str
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class CachedAnswer(SQLModel, table=True):
+    # A chat answer reused for repeated questions; see services/answer_cache.py.
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cache_key: str = Field(index=True, unique=True)  # SHA-256 of scope, mode, model, query and context_hash
+    scope: str = Field(index=True)  # "paper:<id>" or "library"
+    mode: str  # JSON of the request options that shape retrieval
+    model: str = Field(index=True)
+    context_hash: str = Field(index=True)  # retrieved chunk ids, their content hashes and paper summaries
+    query: str
+    query_vector: Optional[bytes] = Field(default=None)  # float16, for near-duplicate lookups
+    answer: str
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    expires_at: datetime = Field(index=True)
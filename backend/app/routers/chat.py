@@ -1,20 +1,55 @@
+import asyncio
+import json
 import os
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
-from chromadb import Client
-from chromadb.config import Settings
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from sqlmodel import Session, select
 
-from backend.app.db import create_db_engine, get_session
+from backend.app.db import get_session
 from backend.app.routers.config import read_config
 from backend.app.models import Chunk
+from backend.app.services.admission import Overloaded, chat_admission
+from backend.app.services.answer_cache import AnswerCache, context_hash, get_answer_cache
+from backend.app.services.chunk_search import reciprocal_rank_fusion, search_chunks
+from backend.app.services.context_packing import context_budget, pack_contexts
+from backend.app.services.embedding_cache import get_embedding_cache, get_query_cache, normalize_query
+from backend.app.services.map_reduce import (
+    CONDENSE_PROMPT,
+    DEFAULT_GROUP_TOKENS,
+    DEFAULT_MAP_CONCURRENCY,
+    map_reduce_contexts,
+)
+from backend.app.services.model_client import CircuitOpenError, apost_json, stream_post
+from backend.app.services.vector_store import open_vector_store, paper_collection_name
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Blocking retrieval work (SQLite, vector search, embedding cache) runs here rather
+# than in Starlette's shared threadpool, so chat load cannot starve other routes.
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHAT_RETRIEVAL_WORKERS", "4")),
+    thread_name_prefix="chat-retrieval",
+)
+
+# Lower bound on per-ranker candidates fetched for hybrid fusion.
+HYBRID_MIN_CANDIDATES = 20
+# Papers kept by the coarse paper-level stage of library-wide searches (CHAT_CANDIDATE_PAPERS; 0 disables).
+DEFAULT_CANDIDATE_PAPERS = 10
+RETRIEVE_BATCH_MAX_QUERIES = 64
+# A batch of two-stage queries is searched once over the union of their candidate papers;
+# each query fetches this many times its quota so filtering to its own papers leaves enough.
+CANDIDATE_UNION_OVERFETCH = 4
+
+
+async def run_retrieval(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_retrieval_executor, fn, *args)
+
 
 class ChatRequest(BaseModel):
     query: str
@@ -23,16 +58,15 @@ class ChatRequest(BaseModel):
     use_embeddings: bool = False
     send_full_text: bool = False
     max_chunks: Optional[int] = None
+    map_reduce: bool = False  # condense the whole paper in parallel groups, then answer from the digests
+    use_cache: bool = True  # False skips the answer cache lookup (the fresh answer is still stored)
 
 
-def get_db_session():
-    engine = create_db_engine()
-    with get_session(engine) as session:
-        yield session
-
-
-def get_chroma_client(persist_directory: str) -> Client:
-    return Client(Settings(is_persistent=True, persist_directory=persist_directory))
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=RETRIEVE_BATCH_MAX_QUERIES)
+    paper_id: Optional[int] = None
+    top_k: int = Field(default=4, ge=1, le=100)
+    use_embeddings: bool = True  # False ranks by BM25 only
 
 
 def ensure_embedding_cfg(cfg: Dict[str, str]) -> Dict[str, str]:
@@ -44,14 +78,54 @@ def ensure_embedding_cfg(cfg: Dict[str, str]) -> Dict[str, str]:
     return {"base_url": base_url, "model": model, "api_key": api_key}
 
 
-def embed_texts(texts: List[str], cfg: Dict[str, str]) -> List[List[float]]:
+async def post_interactive(url: str, headers: Dict[str, str], payload: Dict, timeout: float) -> httpx.Response:
+    # A user is waiting: retry briefly and fail fast while the endpoint's circuit is open.
+    try:
+        return await apost_json(url, headers, payload, timeout=timeout, max_attempts=3, max_delay=5.0)
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from None
+
+
+async def request_embeddings(texts: List[str], cfg: Dict[str, str]) -> List[List[float]]:
     headers = {"Authorization": f"Bearer {cfg['api_key']}", "Content-Type": "application/json"}
     payload = {"model": cfg["model"], "input": texts}
     url = cfg["base_url"].rstrip("/") + "/embeddings"
-    resp = httpx.post(url, headers=headers, json=payload, timeout=60)
-    resp.raise_for_status()
-    data = resp.json()
-    return [item["embedding"] for item in data["data"]]
+    resp = await post_interactive(url, headers, payload, timeout=60)
+    return [item["embedding"] for item in resp.json()["data"]]
+
+
+async def embed_queries(queries: List[str], cfg: Dict[str, str]) -> List[List[float]]:
+    """Embed chat queries via the in-process LRU, then the persistent cache, then one request for the rest."""
+    model = cfg["model"]
+    keys = [normalize_query(q) for q in queries]
+    unique = list(dict.fromkeys(keys))
+    memo = get_query_cache()
+    found: Dict[str, List[float]] = {}
+    if memo is not None:
+        for key in unique:
+            vector = memo.get(model, key)
+            if vector is not None:
+                found[key] = vector
+    missing = [key for key in unique if key not in found]
+    if missing:
+        store = get_embedding_cache()
+        if store is not None:
+            stored = await run_retrieval(store.get_many, model, missing)
+            found.update((key, vector) for key, vector in zip(missing, stored) if vector is not None)
+        fresh = [key for key in missing if key not in found]
+        if fresh:
+            fetched = await request_embeddings(fresh, cfg)
+            if store is not None:
+                await run_retrieval(store.put_many, model, fresh, fetched)
+            found.update(zip(fresh, fetched))
+        if memo is not None:
+            for key in missing:
+                memo.put(model, key, found[key])
+    return [found[key] for key in keys]
+
+
+async def embed_query(query: str, cfg: Dict[str, str]) -> List[float]:
+    return (await embed_queries([query], cfg))[0]
 
 
 def build_context_from_chunks(
@@ -78,6 +152,7 @@ def build_context_from_chunks(
             {
                 "paper_id": row.paper_id,
                 "chunk_id": row.id,
+                "source_path": row.source_path,
                 "seq": row.seq,
                 "score": None,
                 "text": row.content,
@@ -87,7 +162,7 @@ def build_context_from_chunks(
     return contexts
 
 
-def call_chat(model_cfg: Dict[str, str], system_prompt: str, user_prompt: str) -> str:
+def llm_request(model_cfg: Dict[str, str], system_prompt: str, user_prompt: str, stream: bool) -> Tuple[str, Dict, Dict]:
     base_url = model_cfg.get("LLM_BASE_URL") or ""
     model = model_cfg.get("LLM_MODEL") or ""
     api_key = model_cfg.get("LLM_API_KEY") or ""
@@ -102,10 +177,14 @@ def call_chat(model_cfg: Dict[str, str], system_prompt: str, user_prompt: str) -
             {"role": "user", "content": user_prompt},
         ],
         "temperature": 0.2,
-        "stream": False,
+        "stream": stream,
     }
-    resp = httpx.post(url, headers=headers, json=payload, timeout=120)
-    resp.raise_for_status()
+    return url, headers, payload
+
+
+async def call_chat(model_cfg: Dict[str, str], system_prompt: str, user_prompt: str) -> str:
+    url, headers, payload = llm_request(model_cfg, system_prompt, user_prompt, stream=False)
+    resp = await post_interactive(url, headers, payload, timeout=120)
     data = resp.json()
     try:
         return data["choices"][0]["message"]["content"]
@@ -113,17 +192,138 @@ def call_chat(model_cfg: Dict[str, str], system_prompt: str, user_prompt: str) -
         raise HTTPException(status_code=500, detail="Unexpected LLM response") from None
 
 
-@router.post("")
-def chat(req: ChatRequest, session: Session = Depends(get_db_session)):
-    cfg = read_config(session)
+def load_config() -> Dict[str, str]:
+    with get_session() as session:
+        return read_config(session)
+
+
+def load_chunk_contexts(paper_id: int, max_chars: int, max_chunks: int) -> List[Dict[str, Optional[str]]]:
+    with get_session() as session:
+        return build_context_from_chunks(session, paper_id=paper_id, max_chars=max_chars, max_chunks=max_chunks)
+
+
+def load_lexical_contexts(query: str, limit: int, paper_id: Optional[int]) -> List[Dict]:
+    return load_lexical_batch([query], limit, paper_id)[0]
+
+
+def load_lexical_batch(queries: List[str], limit: int, paper_id: Optional[int]) -> List[List[Dict]]:
+    paper_ids = [paper_id] if paper_id else None
+    with get_session() as session:
+        conn = session.connection()
+        return [search_chunks(conn, query, limit, paper_ids=paper_ids) for query in queries]
+
+
+def cap_chars(contexts: List[Dict], max_chars: int) -> List[Dict]:
+    """Keep contexts in rank order until ``max_chars`` of text has been collected."""
+    kept: List[Dict] = []
+    total_chars = 0
+    for ctx in contexts:
+        if total_chars >= max_chars:
+            break
+        kept.append(ctx)
+        total_chars += len(ctx.get("text") or "")
+    return kept
+
+
+def _open_store(cfg: Dict[str, str], name: str):
+    return open_vector_store(
+        cfg.get("CHROMA_PERSIST_DIR") or "./chroma_store",
+        name,
+        backend=cfg.get("VECTOR_BACKEND") or None,
+        quantization=cfg.get("VECTOR_QUANTIZATION") or None,
+    )
+
+
+def pick_papers(cfg: Dict[str, str], query_vecs: List[List[float]]) -> Optional[List[List[int]]]:
+    """Coarse stage: the top CHAT_CANDIDATE_PAPERS papers per query from the paper-level collection.
+
+    Returns None when two-stage retrieval is off or the paper collection has not been built yet.
+    """
+    n_papers = int(os.getenv("CHAT_CANDIDATE_PAPERS", str(DEFAULT_CANDIDATE_PAPERS)))
+    if n_papers <= 0:
+        return None
+    store = _open_store(cfg, paper_collection_name(cfg.get("CHROMA_COLLECTION") or "paper_chunks"))
+    if store.count() == 0:
+        return None
+    return [[hit.metadata.get("paper_id") for hit in hits] for hits in store.query(query_vecs, n_results=n_papers)]
+
+
+def search_vectors(
+    cfg: Dict[str, str],
+    query_vecs: List[List[float]],
+    n_results: int,
+    paper_id: Optional[int],
+    candidate_papers: Optional[List[List[int]]] = None,
+) -> List[List[Dict]]:
+    """Chunk-level vector search; returns a ranked context list per query vector.
+
+    Without ``candidate_papers`` this is one batched query (scoped to ``paper_id``
+    if given). With them it is still one batched query, over the union of all
+    candidate papers, whose hits are then filtered to each query's own papers;
+    only a query left short by that filter is searched again on its own.
+    """
+    store = _open_store(cfg, cfg.get("CHROMA_COLLECTION") or "paper_chunks")
+    if candidate_papers is None or paper_id:
+        results = store.query(query_vecs, n_results=n_results, paper_ids=[paper_id] if paper_id else None)
+    else:
+        union = sorted({pid for papers in candidate_papers for pid in papers})
+        fetch = n_results if len(query_vecs) == 1 else n_results * CANDIDATE_UNION_OVERFETCH
+        pooled = store.query(query_vecs, n_results=fetch, paper_ids=union) if union else [[] for _ in query_vecs]
+        results = []
+        for vec, papers, hits in zip(query_vecs, candidate_papers, pooled):
+            allowed = set(papers)
+            kept = [hit for hit in hits if hit.metadata.get("paper_id") in allowed][:n_results]
+            if len(kept) < n_results and len(hits) == fetch:
+                # Other queries' candidates crowded this one out of the pooled results.
+                kept = store.query([vec], n_results=n_results, paper_ids=papers)[0]
+            results.append(kept)
+    return [
+        [
+            {
+                "paper_id": hit.metadata.get("paper_id"),
+                "chunk_id": hit.metadata.get("chunk_id"),
+                "source_path": hit.metadata.get("source_path"),
+                "seq": hit.metadata.get("seq"),
+                "score": hit.distance,
+                "text": hit.document,
+            }
+            for hit in hits
+        ]
+        for hits in results
+    ]
+
+
+def answer_mode(req: ChatRequest, cfg: Dict[str, str]) -> str:
+    """Request options that shape retrieval and packing; cached answers are only shared within one mode."""
+    return json.dumps(
+        {
+            "use_embeddings": req.use_embeddings,
+            "send_full_text": req.send_full_text,
+            "map_reduce": req.map_reduce,
+            "top_k": req.top_k,
+            "max_chunks": req.max_chunks,
+            "embed_model": (cfg.get("EMBED_MODEL") or cfg.get("LLM_MODEL")) if req.use_embeddings else None,
+            "context_window": cfg.get("LLM_CONTEXT_WINDOW"),
+        },
+        sort_keys=True,
+    )
+
+
+async def prepare_chat(req: ChatRequest) -> Dict:
+    """Retrieve contexts for ``req`` and build the prompts; shared by /chat and /chat/stream.
+
+    When the answer cache holds an answer for the same question over the same
+    retrieved context, the plan carries it as ``hit`` and the LLM call is skipped.
+    """
     if not req.query.strip():
         raise HTTPException(status_code=400, detail="Query is empty")
+    cfg = await run_retrieval(load_config)
     contexts: List[Dict] = []
     source_collection = None
     persist_dir = None
     # Determine chunk count and char limit
     if req.send_full_text:
-        # Send all chunks when full text is requested
+        # Send all chunks when full text is requested; packing trims them to the context budget
         chunk_limit = 999999
         char_limit = 999999
     elif req.max_chunks is not None:
@@ -135,44 +335,76 @@ def chat(req: ChatRequest, session: Session = Depends(get_db_session)):
         chunk_limit = max(1, min(req.top_k, 10))
         char_limit = 4000
 
-    if req.use_embeddings:
+    budget = context_budget(cfg, req.query)
+    map_reduce_report = None
+    candidate_papers: Optional[List[List[int]]] = None
+    query_vec: Optional[List[float]] = None
+    if req.map_reduce:
+        if not req.paper_id:
+            raise HTTPException(status_code=400, detail="paper_id is required for map_reduce")
+        chunks = await run_retrieval(load_chunk_contexts, req.paper_id, 10**12, 10**9)
+
+        async def condense(text: str) -> str:
+            return await call_chat(cfg, CONDENSE_PROMPT, text)
+
+        contexts, map_reduce_report = await map_reduce_contexts(
+            chunks,
+            cfg.get("LLM_MODEL") or "",
+            budget,
+            condense,
+            run_retrieval,
+            group_tokens=int(os.getenv("MAP_REDUCE_GROUP_TOKENS", str(DEFAULT_GROUP_TOKENS))),
+            concurrency=int(os.getenv("MAP_REDUCE_CONCURRENCY", str(DEFAULT_MAP_CONCURRENCY))),
+        )
+        retrieval = "map_reduce"
+    elif req.use_embeddings:
         embed_cfg = ensure_embedding_cfg(cfg)
         persist_dir = cfg.get("CHROMA_PERSIST_DIR") or "./chroma_store"
-        collection_name = cfg.get("CHROMA_COLLECTION") or "paper_chunks"
-        source_collection = collection_name
-        client = get_chroma_client(persist_dir)
-        collection = client.get_or_create_collection(collection_name)
-        query_vec = embed_texts([req.query], embed_cfg)[0]
-        where = {"paper_id": req.paper_id} if req.paper_id else None
-        result = collection.query(
-            query_embeddings=[query_vec],
-            n_results=chunk_limit if chunk_limit < 999999 else 100,
-            where=where,
-        )
-        docs = result.get("documents", [[]])[0] if result else []
-        metas = result.get("metadatas", [[]])[0] if result else []
-        distances = result.get("distances", [[]])[0] if result else []
-
-        for doc, meta, dist in zip(docs, metas, distances):
-            contexts.append(
-                {
-                    "paper_id": meta.get("paper_id"),
-                    "chunk_id": meta.get("chunk_id"),
-                    "seq": meta.get("seq"),
-                    "score": dist,
-                    "text": doc,
-                }
-            )
-    else:
+        source_collection = cfg.get("CHROMA_COLLECTION") or "paper_chunks"
+        n_results = chunk_limit if chunk_limit < 999999 else 100
+        # Each ranker contributes a deeper candidate list than we keep so fusion has overlap to work with.
+        candidates = max(n_results * 2, HYBRID_MIN_CANDIDATES)
+        # BM25 runs while the query is being embedded.
+        lexical = asyncio.ensure_future(run_retrieval(load_lexical_contexts, req.query, candidates, req.paper_id))
+        try:
+            query_vec = await embed_query(req.query, embed_cfg)
+            if not req.paper_id:
+                candidate_papers = await run_retrieval(pick_papers, cfg, [query_vec])
+            semantic = (
+                await run_retrieval(search_vectors, cfg, [query_vec], candidates, req.paper_id, candidate_papers)
+            )[0]
+        finally:
+            lexical_hits = await lexical
+        contexts = reciprocal_rank_fusion([semantic, lexical_hits], n_results)
+        retrieval = "hybrid" if lexical_hits else "vector"
+    elif req.send_full_text:
         if not req.paper_id:
             raise HTTPException(status_code=400, detail="paper_id is required when use_embeddings is false")
-        contexts = build_context_from_chunks(
-            session,
-            paper_id=req.paper_id,
-            max_chars=char_limit,
-            max_chunks=chunk_limit,
+        contexts = await run_retrieval(load_chunk_contexts, req.paper_id, char_limit, chunk_limit)
+        retrieval = "sequential"
+    else:
+        contexts = cap_chars(
+            await run_retrieval(load_lexical_contexts, req.query, chunk_limit, req.paper_id), char_limit
         )
+        retrieval = "lexical"
+        if not contexts:
+            if not req.paper_id:
+                raise HTTPException(status_code=400, detail="paper_id is required when use_embeddings is false")
+            # No term matched (or no FTS index): fall back to the opening chunks of the paper.
+            contexts = await run_retrieval(load_chunk_contexts, req.paper_id, char_limit, chunk_limit)
+            retrieval = "sequential"
 
+    contexts, packing = pack_contexts(contexts, budget)
+    cache = get_answer_cache() if contexts else None
+    mode = answer_mode(req, cfg)
+    context = None
+    hit = None
+    if cache is not None:
+        context = await run_retrieval(context_hash, req.paper_id, contexts)
+        if req.use_cache:
+            hit = await run_retrieval(
+                cache.get, req.paper_id, mode, cfg.get("LLM_MODEL") or "", req.query, context, query_vec
+            )
     context_text = "\n\n".join(
         f"[{idx+1}] (paper {c.get('paper_id')}) {c.get('text')}" for idx, c in enumerate(contexts)
     )
@@ -184,11 +416,193 @@ def chat(req: ChatRequest, session: Session = Depends(get_db_session)):
         " If the answer is not in context, say you are unsure. Keep responses short (<=120 words)."
     )
     user_prompt = f"User question: {req.query}\n\nContext:\n{context_text}"
-
-    answer = call_chat(cfg, system_prompt, user_prompt)
     return {
-        "answer": answer,
+        "hit": hit,
+        "cfg": cfg,
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
         "contexts": contexts,
+        "retrieval": retrieval,
+        "packing": packing,
+        "map_reduce": map_reduce_report,
+        "candidate_papers": candidate_papers[0] if candidate_papers else None,
         "source_collection": source_collection,
         "persist_dir": persist_dir,
+        "answer_cache": cache,
+        "cache_mode": mode,
+        "context_hash": context,
+        "query_vec": query_vec,
+    }
+
+
+def plan_payload(plan: Dict) -> Dict:
+    """The retrieval details returned alongside an answer."""
+    return {
+        "contexts": plan["contexts"],
+        "retrieval": plan["retrieval"],
+        "packing": plan["packing"],
+        "map_reduce": plan["map_reduce"],
+        "candidate_papers": plan["candidate_papers"],
+        "source_collection": plan["source_collection"],
+        "persist_dir": plan["persist_dir"],
+    }
+
+
+async def remember_answer(req: ChatRequest, plan: Dict, answer: str) -> None:
+    # Answers produced without any retrieved context are not cached (answer_cache is None then).
+    cache: Optional[AnswerCache] = plan["answer_cache"]
+    if cache is None or not answer:
+        return
+    await run_retrieval(
+        cache.put,
+        req.paper_id,
+        plan["cache_mode"],
+        plan["cfg"].get("LLM_MODEL") or "",
+        req.query,
+        plan["context_hash"],
+        plan["query_vec"],
+        answer,
+    )
+
+
+async def admit() -> None:
+    try:
+        await chat_admission.acquire()
+    except Overloaded as exc:
+        raise HTTPException(status_code=429, detail=f"Chat is busy: {exc}", headers={"Retry-After": "1"}) from None
+
+
+@router.post("")
+async def chat(req: ChatRequest):
+    await admit()
+    try:
+        plan = await prepare_chat(req)
+        hit = plan["hit"]
+        if hit is not None:
+            return {"answer": hit["answer"], **plan_payload(plan), "cached": True, "cache": hit["cache"]}
+        answer = await call_chat(plan["cfg"], plan["system_prompt"], plan["user_prompt"])
+        await remember_answer(req, plan, answer)
+    finally:
+        chat_admission.release()
+    return {"answer": answer, **plan_payload(plan), "cached": False}
+
+
+@router.post("/retrieve_batch")
+async def retrieve_batch(req: RetrieveBatchRequest):
+    """Retrieve contexts for many queries at once: one embedding request and one batched vector query."""
+    queries = [q.strip() for q in req.queries]
+    if not all(queries):
+        raise HTTPException(status_code=400, detail="Queries must not be empty")
+    await admit()
+    try:
+        cfg = await run_retrieval(load_config)
+        candidates = max(req.top_k * 2, HYBRID_MIN_CANDIDATES) if req.use_embeddings else req.top_k
+        lexical = asyncio.ensure_future(run_retrieval(load_lexical_batch, queries, candidates, req.paper_id))
+        candidate_papers: Optional[List[List[int]]] = None
+        try:
+            semantic: List[List[Dict]] = [[] for _ in queries]
+            if req.use_embeddings:
+                embed_cfg = ensure_embedding_cfg(cfg)
+                query_vecs = await embed_queries(queries, embed_cfg)
+                if not req.paper_id:
+                    candidate_papers = await run_retrieval(pick_papers, cfg, query_vecs)
+                semantic = await run_retrieval(
+                    search_vectors, cfg, query_vecs, candidates, req.paper_id, candidate_papers
+                )
+        finally:
+            lexical_hits = await lexical
+    finally:
+        chat_admission.release()
+    return {
+        "results": [
+            {
+                "query": query,
+                "contexts": reciprocal_rank_fusion([sem, lex], req.top_k),
+                "candidate_papers": candidate_papers[idx] if candidate_papers else None,
+            }
+            for idx, (query, sem, lex) in enumerate(zip(queries, semantic, lexical_hits))
+        ],
+        "source_collection": (cfg.get("CHROMA_COLLECTION") or "paper_chunks") if req.use_embeddings else None,
     }
+
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Holds the request's admission slot until the stream is finished or abandoned."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            chat_admission.release()
+
+
+async def stream_cached(plan: Dict) -> AsyncIterator[str]:
+    """Replay a cached answer with the same events as a live stream, the answer as one delta."""
+    answer = plan["hit"]["answer"]
+    yield sse_event("contexts", {**plan_payload(plan), "cached": True, "cache": plan["hit"]["cache"]})
+    yield sse_event("delta", {"text": answer})
+    yield sse_event("done", {"answer": answer, "cached": True})
+
+
+async def stream_answer(
+    request: Request, req: ChatRequest, plan: Dict, url: str, headers: Dict, payload: Dict
+) -> AsyncIterator[str]:
+    """Relay upstream completion deltas as SSE; leaving the loop closes the upstream request."""
+    yield sse_event("contexts", {**plan_payload(plan), "cached": False})
+    parts: List[str] = []
+    try:
+        async with stream_post(url, headers, payload, timeout=120) as resp:
+            async for line in resp.aiter_lines():
+                if await request.is_disconnected():
+                    return
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    choice = json.loads(data)["choices"][0]
+                except (ValueError, KeyError, IndexError):
+                    continue
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    parts.append(text)
+                    yield sse_event("delta", {"text": text})
+    except CircuitOpenError as exc:
+        yield sse_event("error", {"status": 503, "detail": str(exc)})
+        return
+    except httpx.HTTPStatusError as exc:
+        yield sse_event("error", {"status": exc.response.status_code, "detail": exc.response.text[:500]})
+        return
+    except httpx.HTTPError as exc:
+        yield sse_event("error", {"status": 502, "detail": f"LLM stream failed: {exc}"})
+        return
+    answer = "".join(parts)
+    await remember_answer(req, plan, answer)
+    yield sse_event("done", {"answer": answer, "cached": False})
+
+
+@router.post("/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """Stream the answer as Server-Sent Events: ``contexts`` first, then ``delta`` events, then ``done``."""
+    await admit()
+    try:
+        plan = await prepare_chat(req)
+        if plan["hit"] is not None:
+            events = stream_cached(plan)
+        else:
+            url, headers, payload = llm_request(plan["cfg"], plan["system_prompt"], plan["user_prompt"], stream=True)
+            events = stream_answer(request, req, plan, url, headers, payload)
+    except BaseException:
+        chat_admission.release()
+        raise
+    return AdmittedStreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Stop reverse proxies from buffering the stream and defeating early delivery.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -4,33 +4,44 @@ from typing import Dict, List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 
-from backend.app.db import create_db_engine, get_session
+from backend.app.db import get_db_session
 from backend.app.models import ConfigEntry
+from backend.app.services.model_client import configure_http
+from backend.app.services.vector_store import reset_vector_stores
 
 
 router = APIRouter(prefix="/config", tags=["config"])
 
 
-def get_db_session():
-    engine = create_db_engine()
-    with get_session(engine) as session:
-        yield session
-
-
 # Keys we care about for front-end configuration.
 CONFIG_KEYS: List[str] = [
     "LLM_BASE_URL",
     "LLM_MODEL",
     "LLM_API_KEY",
+    # Context window of LLM_MODEL in tokens; chat packs retrieved context to fit it.
+    "LLM_CONTEXT_WINDOW",
     "EMBED_BASE_URL",
     "EMBED_MODEL",
     "EMBED_API_KEY",
     "EMBED_COLLECTION",
     "CHROMA_PERSIST_DIR",
     "CHROMA_COLLECTION",
+    # Vector store backend: chroma (default) or numpy; numpy also takes float32/float16/int8.
+    "VECTOR_BACKEND",
+    "VECTOR_QUANTIZATION",
+    # Pooled HTTP client for model endpoints (see services/model_client.py).
+    "HTTP_MAX_CONNECTIONS",
+    "HTTP_MAX_KEEPALIVE",
+    "HTTP_KEEPALIVE_EXPIRY",
+    "HTTP_CONNECT_TIMEOUT",
+    "HTTP_HTTP2",
 ]
 
 
+# Changing any of these invalidates cached vector store handles.
+VECTOR_STORE_KEYS = {"CHROMA_PERSIST_DIR", "CHROMA_COLLECTION", "VECTOR_BACKEND", "VECTOR_QUANTIZATION"}
+
+
 def read_config(session: Session) -> Dict[str, str]:
     """Return config values (DB overrides env)."""
     rows = session.exec(select(ConfigEntry).where(ConfigEntry.key.in_(CONFIG_KEYS))).all()
@@ -60,4 +71,9 @@ def upsert_config(payload: Dict[str, str], session: Session = Depends(get_db_ses
         else:
             session.add(ConfigEntry(key=key, value=value))
     session.commit()
-    return {"status": "ok", "entries": read_config(session)}
+    entries = read_config(session)
+    if any(key.startswith("HTTP_") for key in payload):
+        configure_http(entries)
+    if any(key in VECTOR_STORE_KEYS for key in payload):
+        reset_vector_stores()
+    return {"status": "ok", "entries": entries}
@@ -5,19 +5,13 @@ from typing import Optional
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from sqlmodel import Session
 
-from backend.app.db import create_db_engine, get_session
+from backend.app.db import get_db_session
 from backend.app.services.importer import ingest_csv
 
 
 router = APIRouter(prefix="/import", tags=["import"])
 
 
-def get_db_session():
-    engine = create_db_engine()
-    with get_session(engine) as session:
-        yield session
-
-
 @router.post("/csv")
 async def upload_csv(
     file: UploadFile = File(..., description="Zotero 导出的 CSV 文件"),
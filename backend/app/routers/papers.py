@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import func, or_
 from sqlmodel import Session, select
 
-from backend.app.db import create_db_engine, get_session
+from backend.app.db import get_db_session
 from backend.app.models import Chunk, FileAttachment, Paper, Summary, Tag
 
 
@@ -39,12 +39,6 @@ def parse_search_fields(raw: Optional[str]) -> List[str]:
     return expanded or DEFAULT_SEARCH_FIELDS
 
 
-def get_db_session():
-    engine = create_db_engine()
-    with get_session(engine) as session:
-        yield session
-
-
 @router.get("")
 def list_papers(
     q: Optional[str] = Query(default=None, description="Search in title/abstract"),
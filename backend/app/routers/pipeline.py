@@ -3,11 +3,11 @@ from typing import Optional, List
 
 from fastapi import APIRouter, HTTPException, Query, Depends
 from sqlalchemy import func
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from sqlmodel import Session, select
 
-from backend.app.db import create_db_engine, get_session
+from backend.app.db import get_db_session, get_session
 from backend.app.models import FileAttachment, Chunk, Summary, Tag
 from backend.app.services.pipeline import (
     start_process_pdfs,
@@ -22,10 +22,15 @@ from backend.app.services.pipeline import (
     embed_jobs,
 )
 from backend.scripts.dedupe_attachments import dedupe as dedupe_attachments
+from backend.scripts.embed_chunks import embedded_counts
+from backend.app.services.answer_cache import get_answer_cache
+from backend.app.services.embedding_cache import get_embedding_cache, get_query_cache
+from backend.app.services.admission import chat_admission
+from backend.app.services.model_client import endpoint_stats
+from backend.app.services.vector_store import open_vector_store
+from backend.scripts.process_pdfs import ExtractionLimits
 from backend.scripts.summarize_papers import process_papers as summarize_papers
 from backend.app.routers.config import read_config
-from chromadb import Client
-from chromadb.config import Settings
 
 router = APIRouter(prefix="/pipeline", tags=["pipeline"])
 
@@ -35,6 +40,12 @@ class ProcessPdfsRequest(BaseModel):
     overlap: int = 200
     limit: Optional[int] = None
     skip_existing: bool = True
+    workers: int = Field(default=1, ge=1, le=64)
+    doc_timeout: float = Field(default=300.0, gt=0)
+    page_timeout: float = Field(default=60.0, gt=0)
+    max_rss_mb: int = Field(default=1024, ge=64)
+    retry_quarantined: bool = False
+    sandbox: bool = True  # False parses in-process: no child per PDF, but no timeouts or memory cap
 
 
 class JobStopRequest(BaseModel):
@@ -44,7 +55,16 @@ class JobStopRequest(BaseModel):
 @router.post("/process_pdfs/start")
 def process_pdfs_start(req: ProcessPdfsRequest):
     try:
-        job_id = start_process_pdfs(req.chunk_size, req.overlap, req.limit, skip_existing=req.skip_existing)
+        job_id = start_process_pdfs(
+            req.chunk_size,
+            req.overlap,
+            req.limit,
+            skip_existing=req.skip_existing,
+            workers=req.workers,
+            limits=ExtractionLimits(req.doc_timeout, req.page_timeout, req.max_rss_mb),
+            retry_quarantined=req.retry_quarantined,
+            sandbox=req.sandbox,
+        )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Failed to start process_pdfs: {exc}")
     return {"job_id": job_id}
@@ -83,11 +103,16 @@ class EmbedRequest(BaseModel):
     limit_chunks: Optional[int] = None
     collection: str = "paper_chunks"
     persist_dir: str = "./chroma_store"
-    batch_size: int = 16
+    batch_size: int = Field(default=16, ge=1)  # maximum chunks per request
+    max_batch_tokens: Optional[int] = Field(default=8192, ge=1)  # None batches by count only
+    auto_tune: bool = True
     embed_base_url: Optional[str] = None
     embed_model: Optional[str] = None
     embed_api_key: Optional[str] = None
     skip_existing: bool = True
+    max_in_flight: int = Field(default=4, ge=1, le=64)
+    requests_per_minute: Optional[int] = Field(default=None, ge=1)
+    tokens_per_minute: Optional[int] = Field(default=None, ge=1)
 
 
 class JobStopRequest(BaseModel):
@@ -96,13 +121,14 @@ class JobStopRequest(BaseModel):
 
 @router.post("/embed_chunks/start")
 def embed_chunks_start(req: EmbedRequest):
-    engine = create_db_engine()
-    with get_session(engine) as session:
+    with get_session() as session:
         cfg = read_config(session)
     for key, override in [
         ("EMBED_BASE_URL", req.embed_base_url),
         ("EMBED_MODEL", req.embed_model),
         ("EMBED_API_KEY", req.embed_api_key),
+        ("VECTOR_BACKEND", None),
+        ("VECTOR_QUANTIZATION", None),
     ]:
         if override:
             os.environ[key] = override
@@ -114,6 +140,11 @@ def embed_chunks_start(req: EmbedRequest):
         persist_dir=req.persist_dir,
         batch_size=req.batch_size,
         skip_existing=req.skip_existing,
+        max_in_flight=req.max_in_flight,
+        requests_per_minute=req.requests_per_minute,
+        tokens_per_minute=req.tokens_per_minute,
+        max_batch_tokens=req.max_batch_tokens,
+        auto_tune=req.auto_tune,
     )
     return {"job_id": job_id}
 
@@ -137,8 +168,7 @@ def embed_chunks_stop(req: JobStopRequest):
 @router.post("/summarize/start")
 def summarize_start(req: SummarizeRequest):
     # Populate env from config entries so scripts can read them.
-    engine = create_db_engine()
-    with get_session(engine) as session:
+    with get_session() as session:
         cfg = read_config(session)
     for key in ["LLM_BASE_URL", "LLM_MODEL", "LLM_API_KEY"]:
         if cfg.get(key):
@@ -168,12 +198,6 @@ def summarize_stop(req: JobStopRequest):
     return status
 
 
-def get_db_session():
-    engine = create_db_engine()
-    with get_session(engine) as session:
-        yield session
-
-
 @router.get("/stats")
 def pipeline_stats(session: Session = Depends(get_db_session), sample_missing: int = Query(default=20, ge=0, le=200)):
     pdf_attachments: List[FileAttachment] = session.exec(
@@ -221,18 +245,27 @@ def pipeline_stats(session: Session = Depends(get_db_session), sample_missing: i
                 }
             )
     total_chunks_db = session.exec(select(func.count()).select_from(Chunk)).one()
+    embedded_by_model = embedded_counts(session)
+    embed_cache = get_embedding_cache()
+    query_cache = get_query_cache()
+    answer_cache = get_answer_cache()
     # Estimate embedded count from Chroma collection (non-fatal).
     embed_estimate = None
     try:
         cfg = read_config(session)
         persist_dir = cfg.get("CHROMA_PERSIST_DIR") or "./chroma_store"
         collection_name = cfg.get("CHROMA_COLLECTION") or "paper_chunks"
-        client = Client(Settings(is_persistent=True, persist_directory=persist_dir))
-        collection = client.get_or_create_collection(collection_name)
+        store = open_vector_store(
+            persist_dir,
+            collection_name,
+            backend=cfg.get("VECTOR_BACKEND") or None,
+            quantization=cfg.get("VECTOR_QUANTIZATION") or None,
+        )
         embed_estimate = {
             "persist_dir": persist_dir,
             "collection": collection_name,
-            "embedded_count": collection.count(),
+            "backend": type(store).__name__,
+            "embedded_count": store.count(),
         }
     except Exception:
         embed_estimate = None
@@ -251,6 +284,12 @@ def pipeline_stats(session: Session = Depends(get_db_session), sample_missing: i
         "embed_jobs": embed_list,
         "embed_estimate": embed_estimate,
         "chunks_total": total_chunks_db,
+        "embedded_by_model": embedded_by_model,
+        "embedding_cache": embed_cache.stats() if embed_cache else None,
+        "query_cache": query_cache.stats() if query_cache else None,
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "model_endpoints": endpoint_stats(),
+        "chat_admission": chat_admission.stats(),
     }
 
 
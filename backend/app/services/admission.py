@@ -0,0 +1,62 @@
+import asyncio
+import os
+from typing import Optional
+
+
+class Overloaded(RuntimeError):
+    """Admission refused: every slot is busy and the wait queue is full."""
+
+
+class AdmissionLimiter:
+    """Caps concurrent requests on the event loop, queueing a bounded number and refusing the rest.
+
+    Refusal is immediate so clients get a fast 429 instead of timing out in a
+    queue that cannot drain.
+    """
+
+    def __init__(self, max_active: int, max_waiting: int):
+        self.max_active = max(1, max_active)
+        self.max_waiting = max(0, max_waiting)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._admitted = 0
+        self.rejected = 0
+
+    async def acquire(self) -> None:
+        if self._admitted >= self.max_active + self.max_waiting:
+            self.rejected += 1
+            raise Overloaded(f"{self._admitted} requests in progress or queued")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_active)
+        self._admitted += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self._admitted -= 1
+            raise
+
+    def release(self) -> None:
+        self._admitted -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self) -> "AdmissionLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+    def stats(self) -> dict:
+        active = min(self._admitted, self.max_active)
+        return {
+            "active": active,
+            "waiting": self._admitted - active,
+            "max_active": self.max_active,
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+        }
+
+
+chat_admission = AdmissionLimiter(
+    int(os.getenv("CHAT_MAX_CONCURRENCY", "16")),
+    int(os.getenv("CHAT_MAX_QUEUE", "32")),
+)
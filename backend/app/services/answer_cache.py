@@ -0,0 +1,236 @@
+"""
+Cache of chat answers for repeated questions.
+
+Retrieval still runs for every question; the cache only saves the LLM call.
+An answer is keyed by scope, request mode, LLM model, the normalized query and
+a hash of the context it was generated from: the retrieved chunk ids with their
+content hashes plus the latest summary of each paper involved. When an embed
+job, re-chunking or a new summary changes what retrieval returns, the key
+changes with it and the old entry simply stops matching until it expires.
+
+For embedding chats an exact miss falls back to a near-duplicate lookup: an
+entry with the same context whose stored query vector has a cosine similarity
+of at least ANSWER_CACHE_SIMILARITY to the new question. Entries expire after
+ANSWER_CACHE_TTL_SECONDS.
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+
+from backend.app.db import get_session
+from backend.app.models import CachedAnswer, Chunk, Summary
+from backend.app.services.embedding_cache import normalize_query, pack_vector
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_SIMILARITY = 0.95
+# Most recent entries with the same context compared against the query vector.
+SIMILAR_CANDIDATES = 256
+LIBRARY_SCOPE = "library"
+
+
+def answer_scope(paper_id: Optional[int]) -> str:
+    return f"paper:{paper_id}" if paper_id else LIBRARY_SCOPE
+
+
+def answer_key(scope: str, mode: str, model: str, query: str, context_hash: str) -> str:
+    h = hashlib.sha256()
+    for part in (scope, mode, model, normalize_query(query).casefold(), context_hash):
+        h.update(part.encode("utf-8", errors="replace"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _context_sources(paper_id: Optional[int], contexts: Sequence[Dict]) -> Tuple[List[int], List[int]]:
+    chunk_ids = set()
+    paper_ids = {paper_id} if paper_id else set()
+    for ctx in contexts:
+        chunk_ids.update(cid for cid in (ctx.get("chunk_ids") or [ctx.get("chunk_id")]) if cid is not None)
+        if ctx.get("paper_id") is not None:
+            paper_ids.add(ctx["paper_id"])
+    return sorted(chunk_ids), sorted(paper_ids)
+
+
+def context_hash(paper_id: Optional[int], contexts: Sequence[Dict]) -> str:
+    """Hash of the retrieved chunks (ids and current content hashes) and their papers' latest summaries.
+
+    Content hashes are included because SQLite can hand a retired chunk's id to a
+    new chunk.
+    """
+    chunk_ids, paper_ids = _context_sources(paper_id, contexts)
+    h = hashlib.sha256()
+    with get_session() as session:
+        hashes = {}
+        if chunk_ids:
+            hashes = dict(session.exec(select(Chunk.id, Chunk.hash).where(Chunk.id.in_(chunk_ids))).all())
+        for chunk_id in chunk_ids:
+            h.update(f"c{chunk_id}:{hashes.get(chunk_id)}\n".encode())
+        if paper_ids:
+            rows = session.exec(
+                select(Summary.paper_id, func.max(Summary.id))
+                .where(Summary.paper_id.in_(paper_ids))
+                .group_by(Summary.paper_id)
+                .order_by(Summary.paper_id)
+            ).all()
+            for pid, summary_id in rows:
+                h.update(f"s{pid}:{summary_id}\n".encode())
+    return h.hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, ttl_seconds: int, similarity: float):
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        paper_id: Optional[int],
+        mode: str,
+        model: str,
+        query: str,
+        context: str,
+        query_vec: Optional[Sequence[float]] = None,
+    ) -> Optional[Dict]:
+        """Look up an answer for ``query`` over the context hashed as ``context``.
+
+        Returns ``{"answer", "cache"}`` or None. ``query_vec`` enables the
+        near-duplicate fallback.
+        """
+        scope = answer_scope(paper_id)
+        now = datetime.utcnow()
+        with get_session() as session:
+            entry = session.exec(
+                select(CachedAnswer).where(
+                    CachedAnswer.cache_key == answer_key(scope, mode, model, query, context),
+                    CachedAnswer.expires_at > now,
+                )
+            ).first()
+            match, similarity = "exact", 1.0
+            if entry is None and query_vec is not None and self.similarity > 0:
+                entry, similarity = self._nearest(session, scope, mode, model, context, query_vec, now)
+                match = "similar"
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if match == "similar":
+                self.similar_hits += 1
+            else:
+                self.hits += 1
+        return {
+            "answer": entry.answer,
+            "cache": {"match": match, "similarity": round(similarity, 4), "created_at": entry.created_at.isoformat()},
+        }
+
+    def _nearest(
+        self,
+        session: Session,
+        scope: str,
+        mode: str,
+        model: str,
+        context: str,
+        query_vec: Sequence[float],
+        now: datetime,
+    ) -> Tuple[Optional[CachedAnswer], float]:
+        rows = session.exec(
+            select(CachedAnswer.id, CachedAnswer.query_vector)
+            .where(
+                CachedAnswer.context_hash == context,
+                CachedAnswer.scope == scope,
+                CachedAnswer.mode == mode,
+                CachedAnswer.model == model,
+                CachedAnswer.expires_at > now,
+                CachedAnswer.query_vector.is_not(None),
+            )
+            .order_by(CachedAnswer.created_at.desc())
+            .limit(SIMILAR_CANDIDATES)
+        ).all()
+        query = np.asarray(query_vec, dtype=np.float32)
+        rows = [(entry_id, blob) for entry_id, blob in rows if blob and len(blob) == 2 * len(query)]
+        if not rows or not query.any():
+            return None, 0.0
+        matrix = np.stack([np.frombuffer(blob, dtype="<f2") for _, blob in rows]).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None, 0.0
+        return session.get(CachedAnswer, rows[best][0]), float(scores[best])
+
+    def put(
+        self,
+        paper_id: Optional[int],
+        mode: str,
+        model: str,
+        query: str,
+        context: str,
+        query_vec: Optional[Sequence[float]],
+        answer: str,
+    ) -> None:
+        """Store ``answer``, replacing any entry with the same key and dropping expired ones."""
+        scope = answer_scope(paper_id)
+        key = answer_key(scope, mode, model, query, context)
+        now = datetime.utcnow()
+        with get_session() as session:
+            session.exec(delete(CachedAnswer).where(CachedAnswer.expires_at <= now))
+            session.exec(delete(CachedAnswer).where(CachedAnswer.cache_key == key))
+            session.add(
+                CachedAnswer(
+                    cache_key=key,
+                    scope=scope,
+                    mode=mode,
+                    model=model,
+                    context_hash=context,
+                    query=normalize_query(query),
+                    query_vector=pack_vector(query_vec) if query_vec is not None else None,
+                    answer=answer,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                )
+            )
+            session.commit()
+
+    def stats(self) -> dict:
+        with get_session() as session:
+            entries = session.exec(
+                select(func.count()).select_from(CachedAnswer).where(CachedAnswer.expires_at > datetime.utcnow())
+            ).one()
+        with self._lock:
+            hits = self.hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                "entries": entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity": self.similarity,
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+            }
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the process-wide answer cache, or None when disabled (ANSWER_CACHE_TTL_SECONDS=0)."""
+    global _answer_cache
+    ttl = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+    if ttl <= 0:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(ttl, float(os.getenv("ANSWER_CACHE_SIMILARITY", str(DEFAULT_SIMILARITY))))
+    return _answer_cache
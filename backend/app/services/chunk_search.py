@@ -0,0 +1,161 @@
+"""
+Lexical chunk search backed by an SQLite FTS5 index.
+
+``chunk_fts`` mirrors ``chunk.content`` (rowid = chunk.id) and is maintained by
+the ingest path: rows are indexed as ChunkWriter inserts them and removed by
+retire_chunks. FTS5's unicode61 tokenizer splits on whitespace and punctuation,
+which would turn a run of Chinese or Japanese text into one giant token, so CJK
+runs are rewritten as overlapping character bigrams both at index and at query
+time. Ranking uses FTS5's built-in BM25.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+FTS_TABLE = "chunk_fts"
+FTS_BACKFILL_PAGE = 2000
+# Reciprocal rank fusion damping constant from Cormack et al.; 60 is the usual choice.
+RRF_K = 60
+
+# Hiragana/katakana, CJK extension A, CJK unified ideographs, Hangul syllables,
+# compatibility ideographs and the supplementary ideograph planes.
+_CJK_RUN = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\U00020000-\U0002ffff]+")
+_TOKEN = re.compile(r"\w+")
+
+_fts_enabled: Dict[str, bool] = {}
+
+
+def _bigrams(match: "re.Match[str]") -> str:
+    run = match.group(0)
+    if len(run) == 1:
+        return f" {run} "
+    return " " + " ".join(run[i : i + 2] for i in range(len(run) - 1)) + " "
+
+
+def segment(value: str) -> str:
+    """Rewrite CJK runs as space-separated bigrams so unicode61 can tokenize them."""
+    return _CJK_RUN.sub(_bigrams, value)
+
+
+def match_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 MATCH expression: any of the query's terms, each quoted."""
+    terms = list(dict.fromkeys(_TOKEN.findall(segment(query).lower())))
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def ensure_chunk_fts(engine: Engine) -> bool:
+    """Create the FTS table on SQLite (backfilling existing chunks once); False when unsupported."""
+    key = str(engine.url)
+    if engine.dialect.name != "sqlite":
+        _fts_enabled[key] = False
+        return False
+    created = not inspect(engine).has_table(FTS_TABLE)
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    "USING fts5(body, tokenize='unicode61 remove_diacritics 2')"
+                )
+            )
+    except Exception:
+        # SQLite built without FTS5.
+        _fts_enabled[key] = False
+        return False
+    _fts_enabled[key] = True
+    if created:
+        backfill_chunk_fts(engine)
+    return True
+
+
+def fts_enabled(bind) -> bool:
+    """Whether ``bind`` (engine, connection or session bind) has the FTS index."""
+    engine = getattr(bind, "engine", bind)
+    key = str(engine.url)
+    enabled = _fts_enabled.get(key)
+    if enabled is None:
+        enabled = engine.dialect.name == "sqlite" and inspect(engine).has_table(FTS_TABLE)
+        _fts_enabled[key] = enabled
+    return enabled
+
+
+def backfill_chunk_fts(engine: Engine) -> int:
+    """Index every chunk that is not in the FTS table yet, in keyset-paged batches."""
+    indexed = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT id, paper_id, content FROM chunk WHERE id > :last_id "
+                    f"AND NOT EXISTS (SELECT 1 FROM {FTS_TABLE} WHERE rowid = chunk.id) "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": FTS_BACKFILL_PAGE},
+            ).all()
+            if not rows:
+                return indexed
+            index_chunks(conn, rows)
+        indexed += len(rows)
+        last_id = rows[-1][0]
+
+
+def index_chunks(conn: Connection, rows: Iterable[Tuple[int, int, str]]) -> None:
+    """Add (chunk_id, paper_id, content) rows to the FTS index."""
+    params = [{"id": cid, "body": segment(content or "")} for cid, _pid, content in rows]
+    if params:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, body) VALUES (:id, :body)"), params)
+
+
+def unindex_chunks(conn: Connection, chunk_ids: Sequence[int]) -> None:
+    if chunk_ids:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), [{"id": cid} for cid in chunk_ids])
+
+
+def search_chunks(
+    conn: Connection,
+    query: str,
+    limit: int,
+    paper_ids: Optional[Sequence[int]] = None,
+) -> List[Dict]:
+    """BM25-ranked chunks matching ``query``, best first, as chat context dicts."""
+    expr = match_query(query)
+    if expr is None or not fts_enabled(conn):
+        return []
+    params: Dict = {"expr": expr, "limit": limit}
+    scope = ""
+    if paper_ids:
+        marks = ", ".join(f":p{i}" for i in range(len(paper_ids)))
+        scope = f"AND c.paper_id IN ({marks})"
+        params.update({f"p{i}": pid for i, pid in enumerate(paper_ids)})
+    rows = conn.execute(
+        text(
+            f"SELECT c.id, c.paper_id, c.source_path, c.seq, c.content, bm25({FTS_TABLE}) AS rank "
+            f"FROM {FTS_TABLE} JOIN chunk c ON c.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :expr {scope} ORDER BY rank LIMIT :limit"
+        ),
+        params,
+    ).all()
+    # bm25() is negative with lower meaning better; report the magnitude.
+    return [
+        {"paper_id": pid, "chunk_id": cid, "source_path": path, "seq": seq, "score": -rank, "text": content}
+        for cid, pid, path, seq, content, rank in rows
+    ]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Dict]], limit: int, k: int = RRF_K) -> List[Dict]:
+    """Merge ranked context lists by chunk_id with RRF; ``score`` becomes the fused score."""
+    fused: Dict = {}
+    scores: Dict = {}
+    for ranking in rankings:
+        for rank, ctx in enumerate(ranking):
+            key = ctx.get("chunk_id")
+            fused.setdefault(key, ctx)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    ordered = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**fused[key], "score": round(scores[key], 6)} for key in ordered]
@@ -0,0 +1,136 @@
+"""
+Pack retrieved chunks into a prompt under a token budget.
+
+Chunks are cut with a fixed character overlap, so neighbouring chunks repeat
+text. Packing walks the contexts in rank order, keeps those that still fit the
+budget (charging a chunk only for the text its selected predecessor does not
+already cover), then merges runs of consecutive ``seq`` from the same file into
+one block with the overlap removed.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.app.services.tokens import estimate_tokens
+
+DEFAULT_CONTEXT_WINDOW = 8192
+# Held back from the window for the system prompt, the question and the answer.
+RESERVED_TOKENS = 1024
+# Shorter shared edges are treated as coincidence rather than chunk overlap.
+MIN_OVERLAP_CHARS = 16
+MAX_OVERLAP_CHARS = 2000
+
+
+def context_budget(cfg: Dict[str, str], query: str) -> int:
+    """Tokens available for context given LLM_CONTEXT_WINDOW and what the rest of the prompt needs."""
+    try:
+        window = int(cfg.get("LLM_CONTEXT_WINDOW") or DEFAULT_CONTEXT_WINDOW)
+    except ValueError:
+        window = DEFAULT_CONTEXT_WINDOW
+    return max(256, window - RESERVED_TOKENS - estimate_tokens(query))
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """Length of the longest suffix of ``previous`` that is also a prefix of ``following``."""
+    longest = min(len(previous), len(following), MAX_OVERLAP_CHARS)
+    if longest < MIN_OVERLAP_CHARS:
+        return 0
+    probe = following[:MIN_OVERLAP_CHARS]
+    # The earliest match of the probe in the tail gives the longest overlap.
+    pos = previous.find(probe, len(previous) - longest)
+    while pos != -1:
+        if following.startswith(previous[pos:]):
+            return len(previous) - pos
+        pos = previous.find(probe, pos + 1)
+    return 0
+
+
+def _run_key(ctx: Dict) -> Tuple:
+    return ctx.get("paper_id"), ctx.get("source_path")
+
+
+def _select_key(ctx: Dict, rank: int) -> Tuple:
+    # Raw chunks dedupe on their position; derived contexts (no chunk_id, e.g. map-reduce
+    # digests) may share a seq, so each one is keyed by its rank instead.
+    return (*_run_key(ctx), ctx.get("seq"), None if ctx.get("chunk_id") is not None else rank)
+
+
+def _sort_key(key: Tuple) -> Tuple:
+    paper_id, source_path, seq, rank = key
+    return str(paper_id), str(source_path), seq if seq is not None else -1, rank if rank is not None else -1
+
+
+def pack_contexts(contexts: Sequence[Dict], budget_tokens: int) -> Tuple[List[Dict], Dict]:
+    """Select, merge and de-overlap ``contexts`` (best first); returns packed blocks and a report."""
+    selected: Dict[Tuple, Dict] = {}
+    rank_of: Dict[Tuple, int] = {}
+    used = 0
+    raw_selected = 0
+    dropped = 0
+    for rank, ctx in enumerate(contexts):
+        text = ctx.get("text") or ""
+        if not text:
+            continue
+        seq = ctx.get("seq")
+        key = _select_key(ctx, rank)
+        if key in selected:
+            continue
+        cost_text = text
+        previous = None
+        if seq is not None and ctx.get("chunk_id") is not None:
+            previous = selected.get((*_run_key(ctx), seq - 1, None))
+        if previous is not None:
+            cost_text = text[overlap_length(previous["text"], text) :]
+        cost = estimate_tokens(cost_text)
+        if used + cost > budget_tokens:
+            dropped += 1
+            continue
+        used += cost
+        raw_selected += estimate_tokens(text)
+        selected[key] = ctx
+        rank_of[key] = rank
+
+    blocks: List[Dict] = []
+    current: Optional[Dict] = None
+    for key in sorted(selected, key=_sort_key):
+        ctx = selected[key]
+        text = ctx.get("text") or ""
+        # Only raw chunks merge; condensed or otherwise derived contexts have no chunk_id.
+        extends = (
+            current is not None
+            and ctx.get("chunk_id") is not None
+            and current.get("chunk_id") is not None
+            and ctx.get("seq") is not None
+            and _run_key(ctx) == _run_key(current)
+            and ctx["seq"] == current["seq_end"] + 1
+        )
+        if extends:
+            current["text"] += text[overlap_length(current["text"], text) :]
+            current["seq_end"] = ctx["seq"]
+            current["chunk_ids"].append(ctx.get("chunk_id"))
+            current["_rank"] = min(current["_rank"], rank_of[key])
+            continue
+        current = {
+            **ctx,
+            "text": text,
+            "seq_end": ctx.get("seq_end", ctx.get("seq")),
+            "chunk_ids": list(ctx.get("chunk_ids") or [ctx.get("chunk_id")]),
+            "_rank": rank_of[key],
+        }
+        blocks.append(current)
+
+    # Blocks keep the relevance order of their best-ranked chunk.
+    packed = sorted(blocks, key=lambda b: b["_rank"])
+    for block in packed:
+        del block["_rank"]
+    packed_tokens = sum(estimate_tokens(block["text"]) for block in packed)
+    report = {
+        "budget_tokens": budget_tokens,
+        "input_chunks": len(contexts),
+        "packed_chunks": len(selected),
+        "dropped_chunks": dropped,
+        "blocks": len(packed),
+        "tokens_raw": raw_selected,
+        "tokens_packed": packed_tokens,
+        "tokens_saved": raw_selected - packed_tokens,
+    }
+    return packed, report
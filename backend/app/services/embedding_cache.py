@@ -0,0 +1,253 @@
+"""
+Persistent cache of embedding vectors keyed by (model, SHA-256 of the text).
+
+Duplicate chunk text and re-embedding into a new collection reuse vectors that
+were already paid for. Vectors are stored as little-endian float16 blobs in a
+single SQLite file and evicted LRU once the store grows past its size cap.
+Chat queries additionally go through a small in-process LRU keyed by the
+normalized query, with the SQLite store acting as its persistent tier.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+DEFAULT_CACHE_PATH = "./.embedding_cache.sqlite"
+DEFAULT_MAX_MB = 512
+DEFAULT_QUERY_CACHE_SIZE = 2048
+# Evict down to this fraction of the cap so we don't evict on every put.
+EVICT_TARGET_RATIO = 0.9
+# SQLite caps bound parameters per statement; stay well below it for IN (...) lookups.
+LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_sha256 TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_sha256)
+);
+CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    return struct.pack(f"<{len(vector)}e", *vector)
+
+
+def unpack_vector(blob: bytes, dim: int) -> List[float]:
+    return list(struct.unpack(f"<{dim}e", blob))
+
+
+class EmbeddingCache:
+    def __init__(self, db_path: str, max_bytes: int):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        # Running size of the stored vectors, so puts need not scan the table.
+        self._total_bytes = self._stored_bytes()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors aligned with ``texts`` (None where missing)."""
+        shas = [text_sha256(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(shas))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), LOOKUP_BATCH):
+                batch = unique[start : start + LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_sha256, dim, vector FROM embeddings WHERE model = ? AND text_sha256 IN ({marks})",
+                    (model, *batch),
+                ).fetchall()
+                for sha, dim, blob in rows:
+                    found[sha] = unpack_vector(blob, dim)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_sha256 = ?",
+                    [(now, model, sha) for sha in found],
+                )
+                self._conn.commit()
+            result = [found.get(sha) for sha in shas]
+            hit = sum(1 for v in result if v is not None)
+            self.hits += hit
+            self.misses += len(result) - hit
+        return result
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = [(model, text_sha256(t), len(v), pack_vector(v), now) for t, v in zip(texts, vectors)]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_sha256, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._total_bytes += sum(len(row[3]) for row in rows)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        # The running total counts replaced rows twice and misses other processes'
+        # writes, so recount before evicting; this happens about once per 10% of the cap.
+        total = self._stored_bytes()
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        evicted = []
+        for model, sha, nbytes in self._conn.execute(
+            "SELECT model, text_sha256, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        ):
+            if total <= target:
+                break
+            evicted.append((model, sha))
+            total -= nbytes
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_sha256 = ?", evicted)
+        self._total_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            vectors = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            nbytes = self._total_bytes
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "path": self.db_path,
+            "vectors": vectors,
+            "bytes": nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide cache, or None when disabled (EMBED_CACHE_MAX_MB=0)."""
+    global _cache
+    max_mb = int(os.getenv("EMBED_CACHE_MAX_MB", str(DEFAULT_MAX_MB)))
+    if max_mb <= 0:
+        return None
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            db_path = os.getenv("EMBED_CACHE_PATH", DEFAULT_CACHE_PATH)
+            _cache = EmbeddingCache(db_path, max_mb * 1024 * 1024)
+    return _cache
+
+
+def embed_with_cache(
+    texts: List[str],
+    model: str,
+    embed_fn: Callable[[List[str]], List[List[float]]],
+) -> List[List[float]]:
+    """Serve ``texts`` from the cache and call ``embed_fn`` only for the misses."""
+    cache = get_embedding_cache()
+    if cache is None or not texts:
+        return embed_fn(texts)
+    vectors = cache.get_many(model, texts)
+    # Duplicate texts within one call are requested once.
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if missing:
+        fresh = dict(zip(missing, embed_fn(missing)))
+        cache.put_many(model, missing, [fresh[t] for t in missing])
+        vectors = [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+    return vectors
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form for query-vector lookups: NFKC and collapsed whitespace."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query)).strip()
+
+
+class QueryVectorCache:
+    """In-process LRU of (model, normalized query) -> vector in front of the persistent cache."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = OrderedDict()  # (model, normalized query) -> vector
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, query)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, query: str, vector: List[float]) -> None:
+        key = (model, query)
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._vectors),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_query_cache: Optional[QueryVectorCache] = None
+
+
+def get_query_cache() -> Optional[QueryVectorCache]:
+    """Return the process-wide query LRU, or None when disabled (QUERY_CACHE_SIZE=0)."""
+    global _query_cache
+    size = int(os.getenv("QUERY_CACHE_SIZE", str(DEFAULT_QUERY_CACHE_SIZE)))
+    if size <= 0:
+        return None
+    if _query_cache is None:
+        with _cache_lock:
+            if _query_cache is None:
+                _query_cache = QueryVectorCache(size)
+    return _query_cache
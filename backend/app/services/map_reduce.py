@@ -0,0 +1,195 @@
+"""
+Map-reduce answering over a whole paper.
+
+The paper's chunks are split, in order, into groups that fit one LLM call. Each
+group is condensed independently of the question (map) and the condensed texts
+are combined into the final prompt (reduce). Because the map step does not see
+the question, its output is cached in ``GroupDigest`` by a hash of the group
+text and the condense prompt: after the first question about a paper, later
+ones only pay for the reduce call. When the digests of a long paper still
+exceed the budget they are condensed again, level by level.
+"""
+
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from backend.app.db import get_session
+from backend.app.models import GroupDigest
+from backend.app.services.context_packing import pack_contexts
+from backend.app.services.tokens import estimate_tokens
+
+CONDENSE_PROMPT = (
+    "You condense excerpts of research papers for later question answering."
+    " Rewrite the excerpt as a dense summary that keeps every claim, method, dataset, number"
+    " and defined term; drop filler and references. Use at most 200 words."
+)
+# Bump when CONDENSE_PROMPT changes meaningfully so stale digests are not reused.
+CONDENSE_PROMPT_VERSION = "1"
+DEFAULT_GROUP_TOKENS = 3000
+DEFAULT_MAP_CONCURRENCY = 4
+# Levels of re-condensing before the reduce prompt is packed as-is.
+MAX_REDUCE_LEVELS = 3
+
+
+def group_hash(text: str) -> str:
+    h = hashlib.sha256()
+    h.update(CONDENSE_PROMPT_VERSION.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8", errors="replace"))
+    return h.hexdigest()
+
+
+def split_groups(contexts: Sequence[Dict], group_tokens: int) -> List[Dict]:
+    """Cut ordered contexts into groups of about ``group_tokens`` with chunk overlap removed."""
+    groups: List[Dict] = []
+    current: List[Dict] = []
+    size = 0
+
+    def close():
+        if not current:
+            return
+        blocks, _ = pack_contexts(current, budget_tokens=size + 1)
+        text = "\n\n".join(block["text"] for block in blocks)
+        groups.append(
+            {
+                "paper_id": current[0].get("paper_id"),
+                "first_seq": current[0].get("seq"),
+                "last_seq": current[-1].get("seq_end", current[-1].get("seq")),
+                "chunk_ids": [cid for c in current for cid in (c.get("chunk_ids") or [c.get("chunk_id")])],
+                "text": text,
+                "hash": group_hash(text),
+            }
+        )
+
+    for ctx in contexts:
+        tokens = estimate_tokens(ctx.get("text") or "")
+        if current and size + tokens > group_tokens:
+            close()
+            current, size = [], 0
+        current.append(ctx)
+        size += tokens
+    close()
+    return groups
+
+
+def load_digests(model: str, hashes: Sequence[str]) -> Dict[str, str]:
+    if not hashes:
+        return {}
+    with get_session() as session:
+        rows = session.exec(
+            select(GroupDigest.group_hash, GroupDigest.digest).where(
+                GroupDigest.model == model, GroupDigest.group_hash.in_(list(hashes))
+            )
+        ).all()
+    return {h: digest for h, digest in rows}
+
+
+def _digest_insert_stmt(session: Session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_insert(GroupDigest).on_conflict_do_nothing(index_elements=["group_hash", "model"])
+    if dialect == "postgresql":
+        return pg_insert(GroupDigest).on_conflict_do_nothing(index_elements=["group_hash", "model"])
+    return insert(GroupDigest)
+
+
+def save_digests(model: str, groups: Sequence[Dict], digests: Dict[str, str]) -> None:
+    rows = [
+        {
+            "paper_id": g["paper_id"],
+            "model": model,
+            "group_hash": g["hash"],
+            "first_seq": g["first_seq"] if g["first_seq"] is not None else -1,
+            "last_seq": g["last_seq"] if g["last_seq"] is not None else -1,
+            "digest": digests[g["hash"]],
+            "created_at": datetime.utcnow(),
+        }
+        for g in groups
+        if g["hash"] in digests
+    ]
+    if not rows:
+        return
+    with get_session() as session:
+        session.connection().execute(_digest_insert_stmt(session), rows)
+        session.commit()
+
+
+async def condense_groups(
+    groups: Sequence[Dict],
+    model: str,
+    condense: Callable[[str], Awaitable[str]],
+    run_sync: Callable,
+    concurrency: int = DEFAULT_MAP_CONCURRENCY,
+) -> Dict:
+    """Fill each group's ``digest`` from the cache or a parallel condense call; returns counts."""
+    cached = await run_sync(load_digests, model, [g["hash"] for g in groups])
+    missing = list({g["hash"]: g for g in groups if g["hash"] not in cached}.values())
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(group: Dict) -> str:
+        async with limit:
+            return await condense(group["text"])
+
+    tasks = [asyncio.ensure_future(run(g)) for g in missing]
+    try:
+        digests = await asyncio.gather(*tasks)
+    except BaseException:
+        # gather leaves the siblings of a failed call running; cancel them so they
+        # stop spending LLM quota and release their endpoint slots.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    fresh = dict(zip((g["hash"] for g in missing), digests))
+    if fresh:
+        await run_sync(save_digests, model, missing, fresh)
+    for group in groups:
+        group["digest"] = cached[group["hash"]] if group["hash"] in cached else fresh[group["hash"]]
+    return {"groups": len(groups), "cached": len(groups) - len(missing), "condensed": len(missing)}
+
+
+async def map_reduce_contexts(
+    contexts: Sequence[Dict],
+    model: str,
+    budget_tokens: int,
+    condense: Callable[[str], Awaitable[str]],
+    run_sync: Callable,
+    group_tokens: int = DEFAULT_GROUP_TOKENS,
+    concurrency: int = DEFAULT_MAP_CONCURRENCY,
+) -> Tuple[List[Dict], Dict]:
+    """Condense ``contexts`` (one paper, in order) into digest contexts that fit ``budget_tokens``.
+
+    ``condense`` makes the LLM call for one group's text; ``run_sync`` runs the
+    blocking digest-cache reads and writes off the event loop.
+    """
+    group_tokens = max(256, min(group_tokens, budget_tokens))
+    report = {"groups": 0, "cached": 0, "condensed": 0, "levels": 0}
+    layer: List[Dict] = list(contexts)
+    while True:
+        groups = split_groups(layer, group_tokens)
+        counts = await condense_groups(groups, model, condense, run_sync, concurrency)
+        for key, value in counts.items():
+            report[key] += value
+        report["levels"] += 1
+        layer = [
+            {
+                "paper_id": g["paper_id"],
+                "chunk_id": None,
+                "chunk_ids": g["chunk_ids"],
+                "seq": g["first_seq"],
+                "seq_end": g["last_seq"],
+                "score": None,
+                "text": g["digest"],
+            }
+            for g in groups
+        ]
+        total = sum(estimate_tokens(c["text"]) for c in layer)
+        if total <= budget_tokens or len(layer) == 1 or report["levels"] >= MAX_REDUCE_LEVELS:
+            return layer, report
@@ -0,0 +1,450 @@
+import asyncio
+import contextlib
+import email.utils
+import importlib.util
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Mapping, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+# Statuses worth retrying: the request may succeed unchanged a little later.
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+
+class HttpSettings(NamedTuple):
+    max_connections: int = 20
+    max_keepalive: int = 10
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 10.0
+    http2: bool = True
+
+    @classmethod
+    def from_config(cls, cfg: Mapping[str, str]) -> "HttpSettings":
+        """Build settings from HTTP_* config values (ConfigEntry or env); blanks keep defaults."""
+        defaults = cls()
+
+        def pick(key: str, cast, default):
+            value = cfg.get(key)
+            if value in (None, ""):
+                return default
+            try:
+                return cast(value)
+            except ValueError:
+                return default
+
+        return cls(
+            max_connections=pick("HTTP_MAX_CONNECTIONS", int, defaults.max_connections),
+            max_keepalive=pick("HTTP_MAX_KEEPALIVE", int, defaults.max_keepalive),
+            keepalive_expiry=pick("HTTP_KEEPALIVE_EXPIRY", float, defaults.keepalive_expiry),
+            connect_timeout=pick("HTTP_CONNECT_TIMEOUT", float, defaults.connect_timeout),
+            http2=pick("HTTP_HTTP2", lambda v: v.strip().lower() not in ("0", "false", "no", "off"), defaults.http2),
+        )
+
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]").
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_http_settings = HttpSettings.from_config(os.environ)
+
+
+class CircuitOpenError(RuntimeError):
+    """The endpoint failed repeatedly and is cooling down; the call was not attempted."""
+
+
+class RequestStopped(RuntimeError):
+    """The caller's stop event fired while the request was waiting to be (re)tried."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: open after ``threshold`` failures, probe again after ``reset_after`` s."""
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def retry_in(self) -> float:
+        """Seconds until a call may be attempted; 0 when closed or ready for a probe."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self._opened_at + self.reset_after - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._probing:
+                # One half-open probe at a time; others wait for its verdict.
+                return min(1.0, self.reset_after)
+            self._probing = True
+            return 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._probing else "open"
+
+
+class Endpoint:
+    """Shared per-host state: pooled clients, a concurrency cap, a circuit breaker and a 429 cooldown."""
+
+    def __init__(self, key: str, max_concurrency: int, breaker: CircuitBreaker):
+        self.key = key
+        self.max_concurrency = max(1, max_concurrency)
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        # Event-loop callers can't block on the thread semaphore; they get an equal cap of their own.
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self.breaker = breaker
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @staticmethod
+    def _client_kwargs() -> Dict:
+        settings = _http_settings
+        return {
+            "http2": settings.http2 and HTTP2_AVAILABLE,
+            "limits": httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive,
+                keepalive_expiry=settings.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(60.0, connect=settings.connect_timeout),
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        """Keep-alive client for this host, created on first use with the current settings."""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_kwargs())
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Async counterpart of ``client`` for streaming calls made from the event loop."""
+        client = self._async_client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(**self._client_kwargs())
+            return self._async_client
+
+    @property
+    def async_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency cap for ``async_client`` requests, created on first use."""
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_semaphore
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+            async_client, self._async_client = self._async_client, None
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            # Async clients can only be closed on the event loop; aclose_clients() picks them up.
+            with _endpoints_lock:
+                _retired_async_clients.append(async_client)
+
+    def cooldown(self, seconds: float) -> None:
+        # A rate-limit answer pauses every caller of this endpoint, not only the one that saw it.
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    def cooldown_remaining(self) -> float:
+        with self._lock:
+            return max(0.0, self._cooldown_until - time.monotonic())
+
+
+_endpoints: Dict[str, Endpoint] = {}
+_endpoints_lock = threading.Lock()
+_retired_async_clients: List[httpx.AsyncClient] = []
+
+
+def _endpoint_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_endpoint(url: str) -> Endpoint:
+    key = _endpoint_key(url)
+    endpoint = _endpoints.get(key)
+    if endpoint is not None:
+        return endpoint
+    with _endpoints_lock:
+        endpoint = _endpoints.get(key)
+        if endpoint is None:
+            endpoint = Endpoint(
+                key,
+                int(os.getenv("MODEL_MAX_CONCURRENCY", "8")),
+                CircuitBreaker(
+                    int(os.getenv("MODEL_BREAKER_THRESHOLD", "5")),
+                    float(os.getenv("MODEL_BREAKER_RESET_SECONDS", "30")),
+                ),
+            )
+            _endpoints[key] = endpoint
+    return endpoint
+
+
+def configure_http(cfg: Mapping[str, str]) -> HttpSettings:
+    """Apply HTTP_* settings; pooled clients are rebuilt on their next request."""
+    global _http_settings
+    settings = HttpSettings.from_config(cfg)
+    if settings != _http_settings:
+        _http_settings = settings
+        close_clients()
+    return settings
+
+
+def close_clients() -> None:
+    """Close every pooled client (app shutdown, settings change)."""
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    for endpoint in endpoints:
+        endpoint.close()
+
+
+async def aclose_clients() -> None:
+    """Close every pooled client, including async ones, from the event loop (app shutdown)."""
+    close_clients()
+    with _endpoints_lock:
+        retired = list(_retired_async_clients)
+        _retired_async_clients.clear()
+    for client in retired:
+        await client.aclose()
+
+
+def retry_after_seconds(resp: httpx.Response) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    value = resp.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(cap, base * (2**attempt)))
+
+
+def _sleep(seconds: float, stop_event) -> bool:
+    """Sleep, waking early if ``stop_event`` fires; returns True when stopped."""
+    if seconds <= 0:
+        return bool(stop_event and stop_event.is_set())
+    if stop_event is not None:
+        return stop_event.wait(seconds)
+    time.sleep(seconds)
+    return False
+
+
+def post_json(
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict,
+    timeout: float = 60,
+    max_attempts: int = 6,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+    wait_for_circuit: bool = True,
+    max_circuit_wait: float = 600.0,
+    stop_event=None,
+) -> httpx.Response:
+    """POST JSON to a model endpoint with retries, backoff, a circuit breaker and a concurrency cap.
+
+    429/5xx and transport errors are retried with full-jitter backoff, honouring
+    Retry-After. Other 4xx responses raise immediately. Background jobs wait out
+    an open circuit (``wait_for_circuit``, up to ``max_circuit_wait`` seconds);
+    interactive callers get ``CircuitOpenError`` at once instead.
+    """
+    endpoint = get_endpoint(url)
+    attempt = 0
+    circuit_waited = 0.0
+    while True:
+        if _sleep(endpoint.cooldown_remaining(), stop_event):
+            raise RequestStopped(f"{endpoint.key}: stopped during rate-limit cooldown")
+        # Checked last so a half-open probe slot is only claimed right before the request.
+        wait = endpoint.breaker.retry_in()
+        if wait > 0:
+            if not wait_for_circuit or circuit_waited >= max_circuit_wait:
+                raise CircuitOpenError(f"{endpoint.key} is failing; retry in {wait:.0f}s")
+            circuit_waited += wait
+            if _sleep(wait, stop_event):
+                raise RequestStopped(f"{endpoint.key}: stopped while the circuit was open")
+            continue
+
+        retry_wait: Optional[float] = None
+        try:
+            with endpoint.semaphore:
+                resp = endpoint.client.post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    timeout=httpx.Timeout(timeout, connect=_http_settings.connect_timeout),
+                )
+        except httpx.TransportError:
+            endpoint.breaker.record_failure()
+            if attempt + 1 >= max_attempts:
+                raise
+        except Exception:
+            endpoint.breaker.record_failure()
+            raise
+        else:
+            if resp.status_code not in RETRY_STATUSES:
+                # Client errors mean the endpoint is up; only the request is wrong.
+                endpoint.breaker.record_success()
+                resp.raise_for_status()
+                return resp
+            retry_wait = retry_after_seconds(resp)
+            if resp.status_code == 429:
+                endpoint.breaker.record_success()
+                endpoint.cooldown(retry_wait if retry_wait is not None else backoff_delay(attempt, base_delay, max_delay))
+            else:
+                endpoint.breaker.record_failure()
+            if attempt + 1 >= max_attempts:
+                resp.raise_for_status()
+        delay = retry_wait if retry_wait is not None else backoff_delay(attempt, base_delay, max_delay)
+        attempt += 1
+        if _sleep(min(delay, max_delay), stop_event):
+            raise RequestStopped(f"{endpoint.key}: stopped while backing off")
+
+
+@contextlib.asynccontextmanager
+async def stream_post(
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict,
+    timeout: float = 120,
+    max_attempts: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 5.0,
+) -> AsyncIterator[httpx.Response]:
+    """Open a streamed POST to a model endpoint and yield the response once headers arrive.
+
+    Retries follow ``post_json`` but only until the response starts: once bytes are
+    flowing a failure is the caller's to report. An open circuit raises
+    ``CircuitOpenError`` at once. Leaving the ``async with`` block closes the
+    upstream connection, which is how a disconnected client cancels generation.
+    Each attempt, and on success the whole stream, holds one of the endpoint's
+    MODEL_MAX_CONCURRENCY slots.
+    """
+    endpoint = get_endpoint(url)
+    attempt = 0
+    while True:
+        cooldown = endpoint.cooldown_remaining()
+        if cooldown > max_delay:
+            raise CircuitOpenError(f"{endpoint.key} is rate limited; retry in {cooldown:.0f}s")
+        if cooldown > 0:
+            await asyncio.sleep(cooldown)
+        wait = endpoint.breaker.retry_in()
+        if wait > 0:
+            raise CircuitOpenError(f"{endpoint.key} is failing; retry in {wait:.0f}s")
+
+        retry_wait: Optional[float] = None
+        client = endpoint.async_client
+        request = client.build_request(
+            "POST",
+            url,
+            headers=headers,
+            json=payload,
+            timeout=httpx.Timeout(timeout, connect=_http_settings.connect_timeout),
+        )
+        async with endpoint.async_semaphore:
+            try:
+                resp = await client.send(request, stream=True)
+            except httpx.TransportError:
+                endpoint.breaker.record_failure()
+                if attempt + 1 >= max_attempts:
+                    raise
+            except Exception:
+                endpoint.breaker.record_failure()
+                raise
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    endpoint.breaker.record_success()
+                    try:
+                        if resp.is_error:
+                            await resp.aread()
+                            resp.raise_for_status()
+                        yield resp
+                    finally:
+                        await resp.aclose()
+                    return
+                await resp.aclose()
+                retry_wait = retry_after_seconds(resp)
+                if resp.status_code == 429:
+                    endpoint.breaker.record_success()
+                    endpoint.cooldown(
+                        retry_wait if retry_wait is not None else backoff_delay(attempt, base_delay, max_delay)
+                    )
+                else:
+                    endpoint.breaker.record_failure()
+                if attempt + 1 >= max_attempts:
+                    resp.raise_for_status()
+        delay = retry_wait if retry_wait is not None else backoff_delay(attempt, base_delay, max_delay)
+        attempt += 1
+        await asyncio.sleep(min(delay, max_delay))
+
+
+async def apost_json(
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict,
+    timeout: float = 60,
+    max_attempts: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 5.0,
+) -> httpx.Response:
+    """Non-blocking, fail-fast counterpart of ``post_json`` for request handlers on the event loop."""
+    async with stream_post(
+        url, headers, payload, timeout=timeout, max_attempts=max_attempts, base_delay=base_delay, max_delay=max_delay
+    ) as resp:
+        await resp.aread()
+    return resp
+
+
+def endpoint_stats() -> Dict[str, Dict]:
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return {
+        ep.key: {
+            "circuit": ep.breaker.state,
+            "cooldown_s": round(ep.cooldown_remaining(), 1),
+            "http2": _http_settings.http2 and HTTP2_AVAILABLE,
+        }
+        for ep in endpoints
+    }
@@ -0,0 +1,149 @@
+"""
+Content-addressed cache of extracted PDF page text.
+
+Documents are keyed by the SHA-256 of the file bytes, so duplicate attachments
+and re-chunking with different parameters skip pypdf entirely. A path index of
+(size, mtime) avoids re-hashing files that have not changed since they were seen.
+Pages are stored zlib-compressed in a single SQLite file and evicted LRU once the
+store grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional
+
+DEFAULT_CACHE_PATH = "./.pdf_text_cache.sqlite"
+DEFAULT_MAX_MB = 1024
+# Evict down to this fraction of the cap so we don't evict on every put.
+EVICT_TARGET_RATIO = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    page_count INTEGER NOT NULL,
+    nbytes INTEGER NOT NULL,
+    pages BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_documents_last_used ON documents (last_used);
+CREATE TABLE IF NOT EXISTS paths (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PdfTextCache:
+    def __init__(self, db_path: str, max_bytes: int):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def key_for(self, pdf_path: Path) -> Optional[str]:
+        """Return the content hash for a file, reusing the path index when size/mtime match."""
+        try:
+            st = pdf_path.stat()
+        except OSError:
+            return None
+        path = str(pdf_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM paths WHERE path = ?", (path,)
+            ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        sha = file_sha256(pdf_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO paths (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, sha),
+            )
+            self._conn.commit()
+        return sha
+
+    def get(self, sha: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute("SELECT pages FROM documents WHERE sha256 = ?", (sha,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE documents SET last_used = ? WHERE sha256 = ?", (time.time(), sha))
+            self._conn.commit()
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, sha: str, size: int, pages: List[str]) -> None:
+        blob = zlib.compress(json.dumps(pages, ensure_ascii=False).encode("utf-8"), 6)
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, size, page_count, nbytes, pages, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (sha, size, len(pages), len(blob), blob, time.time()),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        rows = self._conn.execute("SELECT sha256, nbytes FROM documents ORDER BY last_used").fetchall()
+        evicted = []
+        for sha, nbytes in rows:
+            if total <= target:
+                break
+            evicted.append((sha,))
+            total -= nbytes
+        self._conn.executemany("DELETE FROM documents WHERE sha256 = ?", evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            docs, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM documents"
+            ).fetchone()
+        return {"path": self.db_path, "documents": docs, "bytes": nbytes, "max_bytes": self.max_bytes}
+
+
+_cache: Optional[PdfTextCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_text_cache() -> Optional[PdfTextCache]:
+    """Return the per-process cache, or None when disabled (PDF_TEXT_CACHE_MAX_MB=0)."""
+    global _cache, _cache_pid
+    max_mb = int(os.getenv("PDF_TEXT_CACHE_MAX_MB", str(DEFAULT_MAX_MB)))
+    if max_mb <= 0:
+        return None
+    # Connections must not cross process boundaries (extraction pool workers).
+    if _cache is not None and _cache_pid == os.getpid():
+        return _cache
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            db_path = os.getenv("PDF_TEXT_CACHE_PATH", DEFAULT_CACHE_PATH)
+            _cache = PdfTextCache(db_path, max_mb * 1024 * 1024)
+            _cache_pid = os.getpid()
+    return _cache
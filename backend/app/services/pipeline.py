@@ -4,16 +4,15 @@ import threading
 import uuid
 from pathlib import Path
 from typing import Dict, Optional
-from sqlmodel import Session
 
-from backend.scripts.process_pdfs import ingest_pdfs
+from backend.scripts.process_pdfs import ExtractionLimits, ingest_pdfs
 from backend.scripts.summarize_papers import process_papers
 from backend.scripts.embed_chunks import (
     get_embedding_endpoint_config,
     embed_chunks as embed_chunks_fn,
-    fetch_chunks,
+    embed_papers,
+    plan_embedding,
 )
-from backend.app.db import create_db_engine
 
 JOB_DIR = Path(".pipeline_jobs")
 JOB_DIR.mkdir(exist_ok=True)
@@ -41,6 +40,7 @@ class JobStatus:
             "total_chunks": 0,
             "missing_files": 0,
             "embedded_skipped": 0,
+            "quarantined": 0,
         }
         self.last_message: str = ""
         self._lock = threading.Lock()
@@ -95,6 +95,11 @@ class JobStatus:
                 "total_chunks",
                 "missing_files",
                 "embedded_skipped",
+                "quarantined",
+                "token_budget",
+                "embed_failed",
+                "papers_embedded",
+                "papers_total",
             ]:
                 if key in payload:
                     self.stats[key] = payload[key]
@@ -105,7 +110,16 @@ summarize_jobs: Dict[str, JobStatus] = {}
 embed_jobs: Dict[str, JobStatus] = {}
 
 
-def start_process_pdfs(chunk_size: int, overlap: int, limit: Optional[int], skip_existing: bool = True) -> str:
+def start_process_pdfs(
+    chunk_size: int,
+    overlap: int,
+    limit: Optional[int],
+    skip_existing: bool = True,
+    workers: int = 1,
+    limits: Optional[ExtractionLimits] = None,
+    retry_quarantined: bool = False,
+    sandbox: bool = True,
+) -> str:
     job_id = str(uuid.uuid4())
     log_path = JOB_DIR / f"{job_id}.log"
     status = JobStatus()
@@ -134,6 +148,10 @@ def start_process_pdfs(chunk_size: int, overlap: int, limit: Optional[int], skip
                     progress_cb=progress_cb,
                     stop_event=stop_flag,
                     skip_existing=skip_existing,
+                    workers=workers,
+                    limits=limits,
+                    retry_quarantined=retry_quarantined,
+                    sandbox=sandbox,
                 )
                 status.stop(0)
             except Exception as exc:
@@ -240,6 +258,11 @@ def start_embed_job(
     persist_dir: str,
     batch_size: int,
     skip_existing: bool = True,
+    max_in_flight: int = 4,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    max_batch_tokens: Optional[int] = None,
+    auto_tune: bool = True,
 ) -> str:
     job_id = str(uuid.uuid4())
     log_path = JOB_DIR / f"{job_id}.log"
@@ -262,24 +285,35 @@ def start_embed_job(
 
             try:
                 cfg = get_embedding_endpoint_config()
-                engine = create_db_engine()
-                with Session(engine) as session:
-                    chunks = fetch_chunks(session, limit=limit_chunks)
-                total = len(chunks)
-                status.update({"stage": "starting", "total_chunks": total, "embedded": 0, "embedded_skipped": 0})
-                if total == 0:
-                    status.stop(0)
-                    return
-                embed_chunks_fn(
-                    collection_name=collection,
-                    persist_dir=persist_dir,
-                    chunks=chunks,
-                    cfg=cfg,
-                    batch_size=batch_size,
-                    progress_cb=progress_cb,
+                rows, total, done = plan_embedding(
+                    persist_dir,
+                    collection,
+                    cfg["model"],
+                    limit=limit_chunks,
                     skip_existing=skip_existing,
-                    stop_event=stop_flag,
+                    progress_cb=progress_cb,
                 )
+                status.update({"stage": "starting", "total_chunks": total, "embedded": 0, "embedded_skipped": done})
+                if total:
+                    embed_chunks_fn(
+                        collection_name=collection,
+                        persist_dir=persist_dir,
+                        chunks=rows,
+                        total_chunks=total,
+                        already_embedded=done,
+                        cfg=cfg,
+                        batch_size=batch_size,
+                        progress_cb=progress_cb,
+                        stop_event=stop_flag,
+                        max_in_flight=max_in_flight,
+                        requests_per_minute=requests_per_minute,
+                        tokens_per_minute=tokens_per_minute,
+                        max_batch_tokens=max_batch_tokens,
+                        auto_tune=auto_tune,
+                    )
+                if not stop_flag.is_set():
+                    # Summaries may have changed even when no chunk needed embedding.
+                    embed_papers(collection, persist_dir, cfg, batch_size=batch_size, progress_cb=progress_cb, stop_event=stop_flag)
                 status.stop(0)
             except Exception as exc:
                 log_line(f"error: {exc}")
@@ -0,0 +1,56 @@
+import threading
+import time
+from typing import Optional
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets shared by concurrent callers."""
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens: int = 0, stop_event=None) -> bool:
+        """Block until one request of ``tokens`` fits both budgets; False if stopped first."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = 0.0
+                need_tokens = 0.0
+                if self._requests:
+                    self._requests.refill(now)
+                    wait = max(wait, self._requests.wait_for(1))
+                if self._tokens:
+                    self._tokens.refill(now)
+                    # A single oversized request may use the whole bucket rather than wait forever.
+                    need_tokens = min(float(tokens), self._tokens.capacity)
+                    wait = max(wait, self._tokens.wait_for(need_tokens))
+                if wait <= 0:
+                    if self._requests:
+                        self._requests.level -= 1
+                    if self._tokens:
+                        self._tokens.level -= need_tokens
+                    return True
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
@@ -0,0 +1,13 @@
+import re
+
+# CJK ideographs, kana and hangul tokenize at roughly one token per character;
+# other scripts average about four characters per token for BPE tokenizers.
+_CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, tokenizer-free token estimate used for batching and rate limiting."""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
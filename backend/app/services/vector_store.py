@@ -0,0 +1,460 @@
+"""
+Vector stores behind the embedding pipeline and chat retrieval.
+
+``ChromaStore`` wraps a Chroma collection and stays the default. ``NumpyStore``
+is a built-in flat index: vectors live in a memory-mapped ``.npy`` matrix
+(float32, float16 or int8 with per-row scales), ids/metadata/documents in a
+small SQLite sidecar, and queries are batched matrix products. Both report
+squared L2 distances, matching Chroma's default space, so results are
+interchangeable. Pick one with VECTOR_BACKEND=chroma|numpy.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+DEFAULT_BACKEND = "chroma"
+QUANTIZATIONS = ("float32", "float16", "int8")
+# Rows scored per matrix product; bounds the temporary (queries x rows) score block.
+QUERY_BLOCK_ROWS = 65536
+INITIAL_CAPACITY = 1024
+
+
+class VectorHit(NamedTuple):
+    id: str
+    distance: float
+    metadata: Dict[str, Any]
+    document: Optional[str]
+
+
+class VectorStore(ABC):
+    """Minimal interface shared by all backends."""
+
+    name: str
+
+    @property
+    def ledger_name(self) -> str:
+        """Collection key for the ChunkEmbedding ledger; distinct per backend so switching re-embeds."""
+        return self.name
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Dict[str, Any]],
+        documents: Sequence[Optional[str]],
+    ) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]) -> None:
+        ...
+
+    @abstractmethod
+    def list_ids(self, limit: int, offset: int = 0) -> List[str]:
+        ...
+
+    @abstractmethod
+    def query(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        n_results: int,
+        paper_ids: Optional[Sequence[int]] = None,
+    ) -> List[List[VectorHit]]:
+        """Top ``n_results`` nearest vectors per query, optionally restricted to ``paper_ids``."""
+
+
+_chroma_clients: Dict[str, Any] = {}
+_stores: Dict[tuple, VectorStore] = {}
+_stores_lock = threading.RLock()
+
+
+def get_chroma_client(persist_directory: str):
+    """Process-wide Chroma client per persist directory; opening one reloads the store from disk."""
+    key = str(Path(persist_directory).resolve())
+    client = _chroma_clients.get(key)
+    if client is not None:
+        return client
+    with _stores_lock:
+        client = _chroma_clients.get(key)
+        if client is None:
+            # Imported lazily: chromadb is slow to import and unused by the numpy backend.
+            from chromadb import Client
+            from chromadb.config import Settings
+
+            client = Client(Settings(is_persistent=True, persist_directory=persist_directory))
+            _chroma_clients[key] = client
+    return client
+
+
+class ChromaStore(VectorStore):
+    def __init__(self, persist_dir: str, name: str, configuration: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.persist_dir = persist_dir
+        client = get_chroma_client(persist_dir)
+        if configuration:
+            self.collection = client.get_or_create_collection(name, configuration=configuration)
+        else:
+            self.collection = client.get_or_create_collection(name)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids, embeddings, metadatas, documents) -> None:
+        self.collection.upsert(ids=list(ids), embeddings=list(embeddings), metadatas=list(metadatas), documents=list(documents))
+
+    def delete(self, ids) -> None:
+        self.collection.delete(ids=list(ids))
+
+    def list_ids(self, limit: int, offset: int = 0) -> List[str]:
+        page = self.collection.get(include=[], limit=limit, offset=offset)
+        return list(page.get("ids", [])) if page else []
+
+    def query(self, embeddings, n_results, paper_ids=None) -> List[List[VectorHit]]:
+        where = None
+        if paper_ids:
+            ids = list(paper_ids)
+            where = {"paper_id": ids[0]} if len(ids) == 1 else {"paper_id": {"$in": ids}}
+        result = self.collection.query(query_embeddings=list(embeddings), n_results=n_results, where=where)
+        hits: List[List[VectorHit]] = []
+        for qi in range(len(embeddings)):
+            ids = (result.get("ids") or [[]] * len(embeddings))[qi]
+            dists = (result.get("distances") or [[]] * len(embeddings))[qi]
+            metas = (result.get("metadatas") or [[]] * len(embeddings))[qi]
+            docs = (result.get("documents") or [[]] * len(embeddings))[qi]
+            hits.append(
+                [VectorHit(vid, float(dist), meta or {}, doc) for vid, dist, meta, doc in zip(ids, dists, metas, docs)]
+            )
+        return hits
+
+
+_NUMPY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS rows (
+    row INTEGER PRIMARY KEY,
+    id TEXT UNIQUE,
+    paper_id INTEGER,
+    metadata TEXT,
+    document TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_rows_paper_id ON rows (paper_id);
+"""
+
+
+class NumpyStore(VectorStore):
+    """Flat exact index over a memory-mapped matrix.
+
+    Deleted rows are cleared (id NULL) and reused by later inserts. A ``version``
+    counter in the sidecar lets readers in other processes notice writes and
+    reload their row index.
+    """
+
+    @property
+    def ledger_name(self) -> str:
+        return f"numpy/{self.name}"
+
+    def __init__(self, persist_dir: str, name: str, quantization: str = "float32"):
+        import numpy as np
+
+        self.np = np
+        self.name = name
+        self.dir = Path(persist_dir) / "numpy" / name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.dir / "index.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_NUMPY_SCHEMA)
+        stored = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if "quantization" in stored:
+            # The on-disk format wins over the requested one; changing it needs a rebuild.
+            quantization = stored["quantization"]
+        elif quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+        else:
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('quantization', ?)", (quantization,))
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('version', '0')")
+            self._conn.commit()
+        self.quantization = quantization
+        self._loaded_version: Optional[int] = None
+        self._matrix = None
+        self._scales = None
+        self._norms = None
+        self._row_ids: Dict[str, int] = {}
+        self._row_paper: Dict[int, Optional[int]] = {}
+        self._paper_rows: Dict[int, Any] = {}
+        self._live = None
+
+    # -- storage -------------------------------------------------------------------
+
+    @property
+    def _dtype(self):
+        return {"float32": self.np.float32, "float16": self.np.float16, "int8": self.np.int8}[self.quantization]
+
+    def _version(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _open_arrays(self, mode: str = "r") -> None:
+        np = self.np
+        path = self.dir / "vectors.npy"
+        if not path.exists():
+            self._matrix = self._scales = self._norms = None
+            return
+        self._matrix = np.load(path, mmap_mode=mode)
+        self._norms = np.load(self.dir / "norms.npy", mmap_mode=mode)
+        scales = self.dir / "scales.npy"
+        self._scales = np.load(scales, mmap_mode=mode) if scales.exists() else None
+
+    def _refresh(self) -> None:
+        """Reload the row index and arrays if another process bumped the version."""
+        version = self._version()
+        if version == self._loaded_version:
+            return
+        self._open_arrays()
+        rows = self._conn.execute("SELECT row, id, paper_id FROM rows WHERE id IS NOT NULL").fetchall()
+        self._row_ids = {vid: row for row, vid, _ in rows}
+        self._row_paper = {row: paper_id for row, _, paper_id in rows}
+        self._live = None
+        self._loaded_version = version
+
+    def _candidates(self, paper_ids: Optional[Sequence[int]]):
+        """Live rows, or the rows of the given papers, from the (lazily rebuilt) id-to-row index."""
+        np = self.np
+        if self._live is None:
+            by_paper: Dict[int, List[int]] = {}
+            for row, paper_id in self._row_paper.items():
+                if paper_id is not None:
+                    by_paper.setdefault(paper_id, []).append(row)
+            self._paper_rows = {pid: np.array(sorted(r), dtype=np.int64) for pid, r in by_paper.items()}
+            self._live = np.array(sorted(self._row_paper), dtype=np.int64)
+        if not paper_ids:
+            return self._live
+        parts = [self._paper_rows[p] for p in paper_ids if p in self._paper_rows]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def _ensure_capacity(self, rows_needed: int, dim: int) -> None:
+        np = self.np
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if self._matrix is not None and self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match store dimension {self._matrix.shape[1]}")
+        if rows_needed <= capacity:
+            return
+        new_capacity = max(INITIAL_CAPACITY, capacity * 2, rows_needed)
+        specs = [("vectors.npy", self._dtype, (new_capacity, dim), self._matrix)]
+        specs.append(("norms.npy", np.float32, (new_capacity,), self._norms))
+        if self.quantization == "int8":
+            specs.append(("scales.npy", np.float32, (new_capacity,), self._scales))
+        for filename, dtype, shape, old in specs:
+            tmp = self.dir / (filename + ".tmp")
+            grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+            if old is not None:
+                grown[: old.shape[0]] = old
+            grown.flush()
+            del grown
+            os.replace(tmp, self.dir / filename)
+        self._open_arrays(mode="r+")
+
+    def _encode(self, vectors):
+        """Quantize float32 rows; returns (stored rows, per-row scales or None, squared norms)."""
+        np = self.np
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            stored = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            decoded = stored.astype(np.float32) * scales[:, None]
+            return stored, scales.astype(np.float32), (decoded * decoded).sum(axis=1)
+        stored = vectors.astype(self._dtype)
+        decoded = stored.astype(np.float32)
+        return stored, None, (decoded * decoded).sum(axis=1)
+
+    # -- VectorStore -----------------------------------------------------------------
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rows WHERE id IS NOT NULL").fetchone()[0]
+
+    def upsert(self, ids, embeddings, metadatas, documents) -> None:
+        np = self.np
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._refresh()
+            free = [r for (r,) in self._conn.execute("SELECT row FROM rows WHERE id IS NULL ORDER BY row").fetchall()]
+            next_row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+            targets: List[int] = []
+            for vid in ids:
+                if vid in self._row_ids:
+                    targets.append(self._row_ids[vid])
+                elif free:
+                    targets.append(free.pop(0))
+                else:
+                    targets.append(next_row)
+                    next_row += 1
+            self._ensure_capacity(max(targets) + 1, vectors.shape[1])
+            if self._matrix is None or not self._matrix.flags.writeable:
+                self._open_arrays(mode="r+")
+            stored, scales, norms = self._encode(vectors)
+            index = np.asarray(targets, dtype=np.int64)
+            self._matrix[index] = stored
+            self._norms[index] = norms
+            if scales is not None:
+                self._scales[index] = scales
+            self._matrix.flush()
+            self._norms.flush()
+            if self._scales is not None:
+                self._scales.flush()
+            # Vectors are flushed before the rows that point at them are committed.
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, paper_id, metadata, document) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (row, vid, (meta or {}).get("paper_id"), json.dumps(meta or {}), doc)
+                    for row, vid, meta, doc in zip(targets, ids, metadatas, documents)
+                ],
+            )
+            self._bump_version()
+            for row, vid, meta in zip(targets, ids, metadatas):
+                self._row_ids[vid] = row
+                self._row_paper[row] = (meta or {}).get("paper_id")
+            self._live = None
+
+    def delete(self, ids) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._refresh()
+            self._conn.executemany(
+                "UPDATE rows SET id = NULL, paper_id = NULL, metadata = NULL, document = NULL WHERE id = ?",
+                [(vid,) for vid in ids],
+            )
+            self._bump_version()
+            for vid in ids:
+                row = self._row_ids.pop(vid, None)
+                if row is not None:
+                    self._row_paper.pop(row, None)
+            self._live = None
+
+    def _bump_version(self) -> None:
+        # Our in-memory index is updated by the caller, so it stays current at the new version.
+        self._conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+        self._conn.commit()
+        self._loaded_version = self._version()
+
+    def list_ids(self, limit: int, offset: int = 0) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM rows WHERE id IS NOT NULL ORDER BY row LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [vid for (vid,) in rows]
+
+    def query(self, embeddings, n_results, paper_ids=None) -> List[List[VectorHit]]:
+        np = self.np
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        with self._lock:
+            self._refresh()
+            matrix, norms, scales = self._matrix, self._norms, self._scales
+            candidates = self._candidates(paper_ids)
+        k = min(n_results, len(candidates))
+        if matrix is None or k <= 0:
+            return [[] for _ in range(len(queries))]
+        q_norms = (queries * queries).sum(axis=1)
+        best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_r = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(candidates), QUERY_BLOCK_ROWS):
+            rows = candidates[start : start + QUERY_BLOCK_ROWS]
+            block = np.asarray(matrix[rows], dtype=np.float32)
+            dots = queries @ block.T
+            if scales is not None:
+                dots *= np.asarray(scales[rows])[None, :]
+            dist = q_norms[:, None] + np.asarray(norms[rows])[None, :] - 2.0 * dots
+            all_d = np.concatenate([best_d, dist], axis=1)
+            all_r = np.concatenate([best_r, np.broadcast_to(rows, dist.shape)], axis=1)
+            if all_d.shape[1] > k:
+                keep = np.argpartition(all_d, k - 1, axis=1)[:, :k]
+                all_d = np.take_along_axis(all_d, keep, axis=1)
+                all_r = np.take_along_axis(all_r, keep, axis=1)
+            best_d, best_r = all_d, all_r
+        order = np.argsort(best_d, axis=1, kind="stable")
+        best_d = np.maximum(np.take_along_axis(best_d, order, axis=1), 0.0)
+        best_r = np.take_along_axis(best_r, order, axis=1)
+        wanted = sorted({int(r) for r in best_r.ravel()})
+        info = {}
+        with self._lock:
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start : start + 500]
+                for row, vid, meta, doc in self._conn.execute(
+                    f"SELECT row, id, metadata, document FROM rows WHERE row IN ({','.join('?' * len(batch))})", batch
+                ).fetchall():
+                    info[row] = (vid, json.loads(meta) if meta else {}, doc)
+        hits: List[List[VectorHit]] = []
+        for qi in range(len(queries)):
+            out = []
+            for row, dist in zip(best_r[qi], best_d[qi]):
+                entry = info.get(int(row))
+                if entry and entry[0] is not None:
+                    out.append(VectorHit(entry[0], float(dist), entry[1], entry[2]))
+            hits.append(out)
+        return hits
+
+
+def paper_collection_name(collection: str) -> str:
+    """Collection holding one vector per paper alongside the chunk collection ``collection``."""
+    return f"{collection}_papers"
+
+
+def open_vector_store(
+    persist_dir: str,
+    name: str,
+    backend: Optional[str] = None,
+    quantization: Optional[str] = None,
+) -> VectorStore:
+    """Open the configured store; arguments fall back to VECTOR_BACKEND / VECTOR_QUANTIZATION."""
+    backend = (backend or os.getenv("VECTOR_BACKEND") or DEFAULT_BACKEND).lower()
+    if backend not in ("chroma", "numpy"):
+        raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}; expected 'chroma' or 'numpy'")
+    quantization = (quantization or os.getenv("VECTOR_QUANTIZATION") or "float32").lower()
+    key = (backend, str(Path(persist_dir).resolve()), name)
+    # Handles are cached per process: Chroma reloads segments on every get_or_create_collection,
+    # and a NumpyStore keeps its row index in memory and serializes writes.
+    store = _stores.get(key)
+    if store is not None:
+        return store
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ChromaStore(persist_dir, name) if backend == "chroma" else NumpyStore(persist_dir, name, quantization)
+            _stores[key] = store
+    return store
+
+
+def reset_vector_stores() -> None:
+    """Drop cached clients and collection handles (vector store config changed)."""
+    with _stores_lock:
+        _stores.clear()
+        _chroma_clients.clear()
+
+
+def warm_vector_store(cfg: Dict[str, str]) -> None:
+    """Open the configured collection ahead of the first chat request; failures are left for that request."""
+    try:
+        store = open_vector_store(
+            cfg.get("CHROMA_PERSIST_DIR") or "./chroma_store",
+            cfg.get("CHROMA_COLLECTION") or "paper_chunks",
+            backend=cfg.get("VECTOR_BACKEND") or None,
+            quantization=cfg.get("VECTOR_QUANTIZATION") or None,
+        )
+        store.count()
+    except Exception:
+        pass
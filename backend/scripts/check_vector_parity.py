@@ -0,0 +1,87 @@
+"""
+Parity check: the NumPy vector store must return the same top-k as Chroma.
+
+Loads the same synthetic vectors into a throwaway Chroma collection and a
+float32 NumpyStore, runs identical queries (with and without paper_id filters)
+and compares result ids. Chroma's HNSW index is approximate, so the check
+collection is built with a search ef large enough to make it exact at this
+size. Quantized stores (float16/int8) are reported as recall@k against the
+float32 results. Exits non-zero on a mismatch.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from backend.app.services.vector_store import ChromaStore, NumpyStore
+
+EXACT_HNSW = {"hnsw": {"ef_search": 2000, "ef_construction": 400, "max_neighbors": 64}}
+
+
+def load(store, ids, vectors, papers, batch: int = 1000):
+    for start in range(0, len(ids), batch):
+        end = start + batch
+        store.upsert(
+            ids[start:end],
+            vectors[start:end].tolist(),
+            [{"paper_id": int(p), "chunk_id": start + i} for i, p in enumerate(papers[start:end])],
+            [f"doc {i}" for i in range(start, min(end, len(ids)))],
+        )
+
+
+def run_queries(store, queries, k, filters):
+    started = time.perf_counter()
+    hits = store.query(queries.tolist(), k)
+    filtered = [store.query([q.tolist()], k, paper_ids=f)[0] for q, f in zip(queries, filters)]
+    return hits, filtered, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare NumPy and Chroma vector store results.")
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--papers", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = np.random.default_rng(args.seed)
+    vectors = rnd.standard_normal((args.vectors, args.dim)).astype(np.float32)
+    papers = rnd.integers(1, args.papers + 1, size=args.vectors)
+    ids = [f"chunk-{i}" for i in range(args.vectors)]
+    queries = rnd.standard_normal((args.queries, args.dim)).astype(np.float32)
+    filters = [sorted({int(p) for p in rnd.integers(1, args.papers + 1, size=3)}) for _ in range(args.queries)]
+
+    report = {"vectors": args.vectors, "dim": args.dim, "k": args.k}
+    with tempfile.TemporaryDirectory() as tmp:
+        chroma = ChromaStore(f"{tmp}/chroma", "parity_check", configuration=EXACT_HNSW)
+        load(chroma, ids, vectors, papers)
+        ref_hits, ref_filtered, report["chroma_s"] = run_queries(chroma, queries, args.k, filters)
+
+        mismatches = 0
+        for quant in ("float32", "float16", "int8"):
+            store = NumpyStore(f"{tmp}/np", f"parity_{quant}", quant)
+            load(store, ids, vectors, papers)
+            hits, filtered, report[f"{quant}_s"] = run_queries(store, queries, args.k, filters)
+            found = total = 0
+            for ref, got in zip(ref_hits + ref_filtered, hits + filtered):
+                ref_ids = [h.id for h in ref]
+                got_ids = [h.id for h in got]
+                found += len(set(ref_ids) & set(got_ids))
+                total += len(ref_ids)
+                if quant == "float32" and ref_ids != got_ids:
+                    mismatches += 1
+            report[f"{quant}_recall"] = round(found / total, 4) if total else None
+        report["float32_mismatched_queries"] = mismatches
+
+    print(json.dumps(report))
+    if mismatches:
+        raise SystemExit("float32 NumPy store disagrees with Chroma")
+
+
+if __name__ == "__main__":
+    main()
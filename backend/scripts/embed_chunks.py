@@ -1,19 +1,46 @@
 import argparse
+import hashlib
 import json
 import os
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import httpx
-from chromadb import Client
-from chromadb.config import Settings
-from sqlmodel import Session, select
+from sqlalchemy import and_, exists, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, delete, select
 
-from backend.app.db import create_db_engine, init_db
-from backend.app.models import Chunk, Paper
+from backend.app.db import create_db_engine, get_session, init_db
+from backend.app.models import Chunk, ChunkEmbedding, Paper, PaperEmbedding, StaleVector, Summary
+from backend.app.services.embedding_cache import embed_with_cache
+from backend.app.services.model_client import CircuitOpenError, RequestStopped, post_json
+from backend.app.services.rate_limit import RateLimiter
+from backend.app.services.tokens import estimate_tokens
+from backend.app.services.vector_store import VectorStore, open_vector_store, paper_collection_name
 
+STALE_DELETE_BATCH = 500
+# Rows fetched per keyset page when streaming chunks to the embedder.
+CHUNK_FETCH_PAGE = 1000
+# Vector ids read per page when seeding the ledger from an existing collection.
+LEDGER_BACKFILL_PAGE = 1000
+# Title + abstract + summary text embedded per paper is capped to stay within model input limits.
+PAPER_TEXT_MAX_CHARS = 6000
 
-def get_chroma_client(persist_directory: str) -> Client:
-    return Client(Settings(is_persistent=True, persist_directory=persist_directory))
+
+class ChunkRow(NamedTuple):
+    """The Chunk columns the embedder needs, without ORM identity-map overhead."""
+
+    id: int
+    paper_id: int
+    source_path: Optional[str]
+    seq: int
+    content: str
+    hash: str
 
 
 def get_embedding_endpoint_config() -> Dict[str, str]:
@@ -25,64 +52,259 @@ def get_embedding_endpoint_config() -> Dict[str, str]:
     return {"base_url": base_url, "model": model, "api_key": api_key}
 
 
+def purge_stale_vectors(store: VectorStore) -> int:
+    """Delete this collection's vectors of chunks retired by re-chunking, then forget them.
+
+    Rows queued for other collections stay until those are purged in turn.
+    """
+    purged = 0
+    with get_session() as session:
+        while True:
+            rows = session.exec(
+                select(StaleVector)
+                .where(StaleVector.collection == store.ledger_name)
+                .order_by(StaleVector.id)
+                .limit(STALE_DELETE_BATCH)
+            ).all()
+            if not rows:
+                break
+            store.delete([row.vector_id for row in rows])
+            session.exec(delete(StaleVector).where(StaleVector.id.in_([row.id for row in rows])))
+            session.commit()
+            purged += len(rows)
+    return purged
+
+
+def embed_texts(texts: List[str], cfg: Dict[str, str], stop_event=None) -> List[List[float]]:
+    headers = {"Authorization": f"Bearer {cfg['api_key']}", "Content-Type": "application/json"}
+    payload = {"model": cfg["model"], "input": texts}
+    url = cfg["base_url"].rstrip("/") + "/embeddings"
+    resp = post_json(url, headers, payload, timeout=60, stop_event=stop_event)
+    data = resp.json()
+    # Expect OpenAI-style response: {"data": [{"embedding": [...]}]}
+    return [item["embedding"] for item in data["data"]]
+
+
+class _EmbeddingStopped(Exception):
+    pass
+
+
+# Provider error fragments meaning "this request is too big", beyond a plain 413.
+TOO_LARGE_MARKERS = (
+    "context length",
+    "context_length",
+    "maximum context",
+    "too many tokens",
+    "token limit",
+    "too long",
+    "input length",
+)
+
+
+def is_request_too_large(exc: Exception) -> bool:
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return False
+    status = exc.response.status_code
+    if status == 413:
+        return True
+    if status not in (400, 422):
+        return False
+    try:
+        body = exc.response.text.lower()
+    except Exception:
+        return False
+    return any(marker in body for marker in TOO_LARGE_MARKERS)
+
+
+class BatchTuner:
+    """Token budget per embedding request, tuned from observed throughput.
+
+    The budget starts at ``max_tokens`` and hill-climbs: every ``window``
+    successful requests, throughput (tokens/s) is compared with the previous
+    window and the budget keeps moving in the same direction while it helps.
+    A request rejected as too large caps the budget below its size for the rest
+    of the run.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        min_tokens: int = 256,
+        window: int = 8,
+        step: float = 1.25,
+        auto_tune: bool = True,
+    ):
+        self.ceiling = max(min_tokens, max_tokens)
+        self.min_tokens = min(min_tokens, self.ceiling)
+        self.budget = self.ceiling
+        self.window = window
+        self.step = step
+        self.auto_tune = auto_tune
+        self._direction = -1  # Start by probing smaller requests; we begin at the ceiling.
+        self._lock = threading.Lock()
+        self._tokens = 0
+        self._seconds = 0.0
+        self._count = 0
+        self._last_throughput: Optional[float] = None
+
+    def record_success(self, tokens: int, seconds: float) -> None:
+        if not self.auto_tune:
+            return
+        with self._lock:
+            self._tokens += tokens
+            self._seconds += seconds
+            self._count += 1
+            if self._count < self.window:
+                return
+            throughput = self._tokens / self._seconds if self._seconds > 0 else 0.0
+            if self._last_throughput is not None and throughput < self._last_throughput:
+                self._direction = -self._direction
+            self._last_throughput = throughput
+            factor = self.step if self._direction > 0 else 1 / self.step
+            self.budget = int(min(self.ceiling, max(self.min_tokens, self.budget * factor)))
+            self._tokens, self._seconds, self._count = 0, 0.0, 0
+
+    def record_too_large(self, tokens: int) -> None:
+        with self._lock:
+            self.ceiling = max(self.min_tokens, min(self.ceiling, int(tokens * 0.8)))
+            self.budget = min(self.budget, self.ceiling)
+            self._last_throughput = None
+            self._tokens, self._seconds, self._count = 0, 0.0, 0
+
+
+def _request_embeddings(
+    texts: List[str],
+    cfg: Dict[str, str],
+    limiter: RateLimiter,
+    stop_event,
+    tuner: Optional[BatchTuner],
+) -> List[List[float]]:
+    """POST one embedding request, halving it recursively if the provider rejects its size."""
+    tokens = sum(estimate_tokens(t) for t in texts)
+    if not limiter.acquire(tokens, stop_event=stop_event):
+        raise _EmbeddingStopped()
+    started = time.monotonic()
+    try:
+        vectors = embed_texts(texts, cfg, stop_event=stop_event)
+    except RequestStopped:
+        raise _EmbeddingStopped() from None
+    except httpx.HTTPStatusError as exc:
+        if len(texts) < 2 or not is_request_too_large(exc):
+            raise
+        if tuner:
+            tuner.record_too_large(tokens)
+        mid = len(texts) // 2
+        return _request_embeddings(texts[:mid], cfg, limiter, stop_event, tuner) + _request_embeddings(
+            texts[mid:], cfg, limiter, stop_event, tuner
+        )
+    if tuner:
+        tuner.record_success(tokens, time.monotonic() - started)
+    return vectors
+
+
+def _embed_batch(
+    texts: List[str],
+    cfg: Dict[str, str],
+    limiter: RateLimiter,
+    stop_event,
+    tuner: Optional[BatchTuner] = None,
+) -> Optional[List[List[float]]]:
+    """Worker body: serve cache hits, then embed the misses once the limiter allows.
+
+    Returns None when stopped while waiting for rate budget.
+    """
+    try:
+        return embed_with_cache(
+            texts, cfg["model"], lambda missing: _request_embeddings(missing, cfg, limiter, stop_event, tuner)
+        )
+    except _EmbeddingStopped:
+        return None
+
+
+def _token_batches(rows: Iterator[ChunkRow], batch_size: int, tuner: Optional[BatchTuner]) -> Iterator[List[ChunkRow]]:
+    """Group rows into batches of at most ``batch_size`` rows and the tuner's token budget."""
+    held: Optional[ChunkRow] = None
+    while True:
+        budget = tuner.budget if tuner else None
+        batch: List[ChunkRow] = []
+        used = 0
+        while len(batch) < batch_size:
+            row = held if held is not None else next(rows, None)
+            held = None
+            if row is None:
+                break
+            cost = estimate_tokens(row.content)
+            if batch and budget is not None and used + cost > budget:
+                held = row
+                break
+            batch.append(row)
+            used += cost
+        if not batch:
+            return
+        yield batch
+
+
 def embed_chunks(
     collection_name: str,
     persist_dir: str,
-    chunks: List[Chunk],
+    chunks: Iterable[ChunkRow],
     cfg: Dict[str, str],
     batch_size: int = 16,
     progress_cb=None,
-    skip_existing: bool = True,
     stop_event=None,
+    max_in_flight: int = 4,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    total_chunks: Optional[int] = None,
+    already_embedded: int = 0,
+    max_batch_tokens: Optional[int] = None,
+    auto_tune: bool = True,
 ) -> int:
-    client = get_chroma_client(persist_dir)
-    collection = client.get_or_create_collection(collection_name)
+    """Embed chunks into a vector store collection with up to ``max_in_flight`` concurrent requests.
+
+    Batches are submitted to a thread pool in chunk order and upserted strictly in
+    that order as they complete, so progress events stay monotonic. The optional
+    RPM/TPM limiter keeps the request stream within the provider's rate limits.
+    ``chunks`` may be a lazy iterator (see ``plan_embedding``); pass ``total_chunks``
+    for progress reporting when it has no length. Every successful upsert is
+    recorded in the ChunkEmbedding ledger, which is how later runs skip work.
+    With ``max_batch_tokens`` a batch is also cut at that estimated token count
+    (``batch_size`` stays the row cap), oversized requests are split, and the
+    budget is auto-tuned within the limit unless ``auto_tune`` is off.
+    """
+    store = open_vector_store(persist_dir, collection_name)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    tuner = BatchTuner(max_batch_tokens, auto_tune=auto_tune) if max_batch_tokens else None
     inserted = 0
-    skipped = 0
-    effective_total = len(chunks)
-
-    def embed_texts(texts: List[str]) -> List[List[float]]:
-        headers = {"Authorization": f"Bearer {cfg['api_key']}", "Content-Type": "application/json"}
-        payload = {"model": cfg["model"], "input": texts}
-        url = cfg["base_url"].rstrip("/") + "/embeddings"
-        resp = httpx.post(url, headers=headers, json=payload, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-        # Expect OpenAI-style response: {"data": [{"embedding": [...]}]}
-        return [item["embedding"] for item in data["data"]]
-
-    total = len(chunks)
-    for start in range(0, total, batch_size):
-        if stop_event and stop_event.is_set():
-            break
-        batch = chunks[start : start + batch_size]
-        texts = [c.content for c in batch]
-        ids = [f"chunk-{c.id}" for c in batch]
-        if skip_existing:
-            existing = collection.get(ids=ids)
-            existing_ids = set(existing.get("ids", [])) if existing else set()
-            if existing_ids:
-                filtered = [(c, t, i) for c, t, i in zip(batch, texts, ids) if i not in existing_ids]
-                skipped_now = len(batch) - len(filtered)
-                skipped += skipped_now
-                effective_total -= skipped_now
-                batch = [c for c, _, _ in filtered]
-                texts = [t for _, t, _ in filtered]
-                ids = [i for _, _, i in filtered]
-        if not batch:
+    failed = 0
+    skipped = already_embedded
+    effective_total = total_chunks if total_chunks is not None else len(chunks)
+    inflight: deque = deque()
+
+    def upsert_oldest():
+        nonlocal inserted, failed
+        batch, texts, ids, future = inflight.popleft()
+        try:
+            embeddings = future.result()
+        except CircuitOpenError:
+            raise
+        except Exception as exc:
+            # Retries are exhausted for this batch only; keep going and let the
+            # ledger pick these chunks up on the next run.
+            failed += len(batch)
             if progress_cb:
                 progress_cb(
                     {
                         "stage": "embedding",
+                        "error": str(exc),
                         "embedded": inserted,
-                        "total_chunks": max(effective_total, 0),
-                        "embedded_skipped": skipped,
-                        "batch": 0,
-                        "last_chunk_id": None,
+                        "embed_failed": failed,
+                        "last_chunk_id": batch[-1].id,
                     }
                 )
-            continue
-        embeddings = embed_texts(texts)
+            return
+        if embeddings is None:
+            return
         metadatas = [
             {
                 "paper_id": c.paper_id,
@@ -92,7 +314,8 @@ def embed_chunks(
             }
             for c in batch
         ]
-        collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+        store.upsert(ids, embeddings, metadatas, texts)
+        record_embeddings(batch, cfg["model"], store.ledger_name)
         inserted += len(batch)
         if progress_cb:
             progress_cb(
@@ -100,56 +323,375 @@ def embed_chunks(
                     "stage": "embedding",
                     "embedded": inserted,
                     "embedded_skipped": skipped,
+                    "embed_failed": failed,
                     "total_chunks": max(effective_total, 0),
                     "batch": len(batch),
                     "last_chunk_id": batch[-1].id if batch else None,
+                    "token_budget": tuner.budget if tuner else None,
                 }
             )
+
+    batches = _token_batches(iter(chunks), max(1, batch_size), tuner)
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="embed") as pool:
+        try:
+            for batch in batches:
+                if stop_event and stop_event.is_set():
+                    break
+                texts = [c.content for c in batch]
+                ids = [f"chunk-{c.id}" for c in batch]
+                future = pool.submit(_embed_batch, texts, cfg, limiter, stop_event, tuner)
+                inflight.append((batch, texts, ids, future))
+                while len(inflight) >= max(1, max_in_flight):
+                    upsert_oldest()
+            # Batches already sent are paid for; keep them even when stopping.
+            while inflight:
+                upsert_oldest()
+        finally:
+            for *_, future in inflight:
+                future.cancel()
     return inserted
 
 
-def fetch_chunks(session: Session, limit: Optional[int] = None) -> List[Chunk]:
-    stmt = select(Chunk).order_by(Chunk.id)
-    if limit:
-        stmt = stmt.limit(limit)
-    return session.exec(stmt).all()
+def _ledger_insert_stmt(session: Session):
+    # Re-embedding a chunk (skip_existing=False or changed content) refreshes its ledger row.
+    dialect = session.get_bind().dialect.name
+    keys = ["chunk_id", "model", "collection"]
+    if dialect == "sqlite":
+        stmt = sqlite_insert(ChunkEmbedding)
+    elif dialect == "postgresql":
+        stmt = pg_insert(ChunkEmbedding)
+    else:
+        return insert(ChunkEmbedding)
+    return stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={"content_hash": stmt.excluded.content_hash, "created_at": stmt.excluded.created_at},
+    )
+
+
+def record_embeddings(rows: List[ChunkRow], model: str, collection_name: str) -> None:
+    if not rows:
+        return
+    now = datetime.utcnow()
+    with get_session() as session:
+        session.connection().execute(
+            _ledger_insert_stmt(session),
+            [
+                {"chunk_id": r.id, "model": model, "collection": collection_name, "content_hash": r.hash, "created_at": now}
+                for r in rows
+            ],
+        )
+        session.commit()
+
+
+def backfill_ledger(store: VectorStore, model: str, collection_name: str) -> int:
+    """Seed the ledger from vectors in a collection the ledger has never seen.
+
+    Collections built before the ledger existed carry no model information, so
+    their vectors are attributed to the currently configured model — the same
+    assumption the old id-based skip check made.
+    """
+    with get_session() as session:
+        has_rows = session.exec(
+            select(ChunkEmbedding.id).where(ChunkEmbedding.collection == collection_name).limit(1)
+        ).first()
+    if has_rows is not None or store.count() == 0:
+        return 0
+    seeded = 0
+    offset = 0
+    while True:
+        vector_ids = store.list_ids(LEDGER_BACKFILL_PAGE, offset)
+        if not vector_ids:
+            break
+        offset += len(vector_ids)
+        chunk_ids = [int(v[len("chunk-") :]) for v in vector_ids if v.startswith("chunk-") and v[len("chunk-") :].isdigit()]
+        if not chunk_ids:
+            continue
+        with get_session() as session:
+            rows = session.exec(select(Chunk.id, Chunk.hash).where(Chunk.id.in_(chunk_ids))).all()
+        record_embeddings([ChunkRow(cid, 0, None, 0, "", h) for cid, h in rows], model, collection_name)
+        seeded += len(rows)
+    return seeded
+
+
+def _pending_filter(model: Optional[str], collection_name: Optional[str]):
+    """Anti-join: chunks with no ledger row for this model/collection and current content."""
+    if model is None or collection_name is None:
+        return None
+    ledger = (
+        select(ChunkEmbedding.id)
+        .where(
+            and_(
+                ChunkEmbedding.chunk_id == Chunk.id,
+                ChunkEmbedding.model == model,
+                ChunkEmbedding.collection == collection_name,
+                ChunkEmbedding.content_hash == Chunk.hash,
+            )
+        )
+        .exists()
+    )
+    return ~ledger
+
+
+def count_chunks(
+    session: Session,
+    limit: Optional[int] = None,
+    model: Optional[str] = None,
+    collection_name: Optional[str] = None,
+) -> int:
+    stmt = select(func.count()).select_from(Chunk)
+    pending = _pending_filter(model, collection_name)
+    if pending is not None:
+        stmt = stmt.where(pending)
+    total = session.exec(stmt).one()
+    return min(total, limit) if limit else total
+
+
+def iter_chunks(
+    limit: Optional[int] = None,
+    page_size: int = CHUNK_FETCH_PAGE,
+    model: Optional[str] = None,
+    collection_name: Optional[str] = None,
+) -> Iterator[ChunkRow]:
+    """Stream chunks in id order using keyset pagination.
+
+    Each page is read in its own short session, so only one page of rows is held
+    in memory and no long read transaction pins the SQLite WAL during embedding.
+    With ``model`` and ``collection_name`` only chunks missing from the ledger are
+    returned; rows recorded mid-run sit behind the keyset cursor, so paging stays stable.
+    """
+    pending = _pending_filter(model, collection_name)
+    last_id = 0
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        stmt = select(Chunk.id, Chunk.paper_id, Chunk.source_path, Chunk.seq, Chunk.content, Chunk.hash).where(
+            Chunk.id > last_id
+        )
+        if pending is not None:
+            stmt = stmt.where(pending)
+        stmt = stmt.order_by(Chunk.id).limit(size)
+        with get_session() as session:
+            page = [ChunkRow(*row) for row in session.exec(stmt).all()]
+        if not page:
+            return
+        yield from page
+        last_id = page[-1].id
+        if remaining is not None:
+            remaining -= len(page)
+
+
+def plan_embedding(
+    persist_dir: str,
+    collection_name: str,
+    model: str,
+    limit: Optional[int] = None,
+    skip_existing: bool = True,
+    progress_cb=None,
+) -> Tuple[Iterator[ChunkRow], int, int]:
+    """Return (chunks to embed, how many, how many are already embedded) for one run.
+
+    Vectors of retired chunks are purged from the collection first, so a
+    re-chunk that leaves nothing new to embed still clears them.
+    """
+    store = open_vector_store(persist_dir, collection_name)
+    purged = purge_stale_vectors(store)
+    if purged and progress_cb:
+        progress_cb({"stage": "purged_stale", "purged_vectors": purged})
+    if not skip_existing:
+        with get_session() as session:
+            total = count_chunks(session, limit=limit)
+        return iter_chunks(limit=limit), total, 0
+    backfill_ledger(store, model, store.ledger_name)
+    with get_session() as session:
+        pending = count_chunks(session, model=model, collection_name=store.ledger_name)
+        done = count_chunks(session) - pending
+    rows = iter_chunks(limit=limit, model=model, collection_name=store.ledger_name)
+    return rows, min(pending, limit) if limit else pending, done
+
+
+def embedded_counts(session: Session) -> List[Dict[str, Any]]:
+    """Embedded chunk counts per (model, collection), counting only current chunk content."""
+    rows = session.exec(
+        select(ChunkEmbedding.model, ChunkEmbedding.collection, func.count())
+        .join(Chunk, and_(Chunk.id == ChunkEmbedding.chunk_id, Chunk.hash == ChunkEmbedding.content_hash))
+        .group_by(ChunkEmbedding.model, ChunkEmbedding.collection)
+    ).all()
+    return [{"model": model, "collection": coll, "embedded": count} for model, coll, count in rows]
+
+
+def paper_text(title: Optional[str], abstract: Optional[str], one_liner: Optional[str], long_summary: Optional[str]) -> str:
+    parts = [title, abstract, one_liner, long_summary]
+    return "\n\n".join(p.strip() for p in parts if p and p.strip())[:PAPER_TEXT_MAX_CHARS]
+
+
+def pending_papers(model: str, collection_name: str) -> List[Tuple[int, str, str]]:
+    """(paper_id, text, hash) for chunked papers whose paper-level text changed since it was embedded."""
+    latest = (
+        select(Summary.paper_id, func.max(Summary.id).label("summary_id")).group_by(Summary.paper_id).subquery()
+    )
+    stmt = (
+        select(Paper.id, Paper.title, Paper.abstract, Summary.one_liner, Summary.long_summary)
+        .where(exists().where(Chunk.paper_id == Paper.id))
+        .outerjoin(latest, latest.c.paper_id == Paper.id)
+        .outerjoin(Summary, Summary.id == latest.c.summary_id)
+        .order_by(Paper.id)
+    )
+    pending: List[Tuple[int, str, str]] = []
+    with get_session() as session:
+        done = dict(
+            session.exec(
+                select(PaperEmbedding.paper_id, PaperEmbedding.content_hash).where(
+                    PaperEmbedding.model == model, PaperEmbedding.collection == collection_name
+                )
+            ).all()
+        )
+        for paper_id, title, abstract, one_liner, long_summary in session.exec(stmt):
+            text = paper_text(title, abstract, one_liner, long_summary)
+            if not text:
+                continue
+            text_hash = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+            if done.get(paper_id) != text_hash:
+                pending.append((paper_id, text, text_hash))
+    return pending
+
+
+def _paper_ledger_insert_stmt(session: Session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(PaperEmbedding)
+    elif dialect == "postgresql":
+        stmt = pg_insert(PaperEmbedding)
+    else:
+        return insert(PaperEmbedding)
+    return stmt.on_conflict_do_update(
+        index_elements=["paper_id", "model", "collection"],
+        set_={"content_hash": stmt.excluded.content_hash, "created_at": stmt.excluded.created_at},
+    )
+
+
+def embed_papers(
+    collection_name: str,
+    persist_dir: str,
+    cfg: Dict[str, str],
+    batch_size: int = 16,
+    progress_cb=None,
+    stop_event=None,
+) -> int:
+    """Keep the paper-level collection (one vector per chunked paper) in step with the catalog.
+
+    Each paper is embedded from its title, abstract and latest AI summary; the
+    PaperEmbedding ledger re-embeds a paper only when that text changes, e.g.
+    after a new summary. Chat uses this collection to pick candidate papers
+    before searching their chunks.
+    """
+    store = open_vector_store(persist_dir, paper_collection_name(collection_name))
+    pending = pending_papers(cfg["model"], store.ledger_name)
+    embedded = 0
+    if progress_cb:
+        progress_cb({"stage": "embedding_papers", "papers_embedded": 0, "papers_total": len(pending)})
+    for start in range(0, len(pending), max(1, batch_size)):
+        if stop_event and stop_event.is_set():
+            break
+        batch = pending[start : start + max(1, batch_size)]
+        texts = [text for _, text, _ in batch]
+        try:
+            vectors = embed_with_cache(texts, cfg["model"], lambda missing: embed_texts(missing, cfg, stop_event))
+        except RequestStopped:
+            break
+        store.upsert(
+            [f"paper-{paper_id}" for paper_id, _, _ in batch],
+            vectors,
+            [{"paper_id": paper_id} for paper_id, _, _ in batch],
+            texts,
+        )
+        with get_session() as session:
+            now = datetime.utcnow()
+            session.connection().execute(
+                _paper_ledger_insert_stmt(session),
+                [
+                    {
+                        "paper_id": paper_id,
+                        "model": cfg["model"],
+                        "collection": store.ledger_name,
+                        "content_hash": text_hash,
+                        "created_at": now,
+                    }
+                    for paper_id, _, text_hash in batch
+                ],
+            )
+            session.commit()
+        embedded += len(batch)
+        if progress_cb:
+            progress_cb({"stage": "embedding_papers", "papers_embedded": embedded, "papers_total": len(pending)})
+    return embedded
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Embed chunks into Chroma vector store.")
+    parser = argparse.ArgumentParser(description="Embed chunks into the vector store (VECTOR_BACKEND, default Chroma).")
     parser.add_argument("--limit-chunks", type=int, default=None, help="Limit number of chunks for a dry run.")
     parser.add_argument(
         "--persist-dir",
         type=str,
         default="./chroma_store",
-        help="Chroma persistence directory.",
+        help="Vector store persistence directory.",
     )
     parser.add_argument(
         "--collection",
         type=str,
         default="paper_chunks",
-        help="Chroma collection name.",
+        help="Vector collection name.",
+    )
+    parser.add_argument("--batch-size", type=int, default=16, help="Maximum chunks per embedding request.")
+    parser.add_argument(
+        "--max-batch-tokens",
+        type=int,
+        default=8192,
+        help="Estimated-token budget per request (0 batches by count only).",
     )
-    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--no-auto-tune", action="store_true", help="Keep the token budget fixed.")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Concurrent embedding requests.")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests-per-minute limit of the endpoint.")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens-per-minute limit of the endpoint.")
+    parser.add_argument("--skip-papers", action="store_true", help="Do not update the paper-level collection.")
     args = parser.parse_args()
 
     engine = create_db_engine()
     init_db(engine)
     cfg = get_embedding_endpoint_config()
 
-    with Session(engine) as session:
-        chunks = fetch_chunks(session, limit=args.limit_chunks)
-    if not chunks:
+    rows, total, done = plan_embedding(args.persist_dir, args.collection, cfg["model"], limit=args.limit_chunks)
+    if not total and not done:
         print("No chunks found. Run process_pdfs first.")
         return
-    inserted = embed_chunks(
-        collection_name=args.collection,
-        persist_dir=args.persist_dir,
-        chunks=chunks,
-        cfg=cfg,
-        batch_size=args.batch_size,
+    inserted = 0
+    if not total:
+        print("No chunks to embed.")
+    else:
+        inserted = embed_chunks(
+            collection_name=args.collection,
+            persist_dir=args.persist_dir,
+            chunks=rows,
+            total_chunks=total,
+            already_embedded=done,
+            cfg=cfg,
+            batch_size=args.batch_size,
+            max_batch_tokens=args.max_batch_tokens or None,
+            auto_tune=not args.no_auto_tune,
+            max_in_flight=args.max_in_flight,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+        )
+    papers = 0 if args.skip_papers else embed_papers(args.collection, args.persist_dir, cfg, batch_size=args.batch_size)
+    print(
+        json.dumps(
+            {
+                "embedded": inserted,
+                "papers_embedded": papers,
+                "collection": args.collection,
+                "persist_dir": args.persist_dir,
+            }
+        )
     )
-    print(json.dumps({"embedded": inserted, "collection": args.collection, "persist_dir": args.persist_dir}))
 
 
 if __name__ == "__main__":
@@ -1,45 +1,242 @@
 import argparse
 import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
 from pypdf import PdfReader
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from sqlalchemy import delete, distinct, exists, func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Session, select
 
-from backend.app.db import create_db_engine, init_db
-from backend.app.models import Chunk, FileAttachment, Paper
+from backend.app.db import create_db_engine, init_db, retire_chunk_ids
+from backend.app.models import Chunk, FileAttachment, GroupDigest, Paper, QuarantinedFile
+from backend.app.services.chunk_search import fts_enabled, index_chunks
+from backend.app.services.pdf_cache import file_sha256, get_pdf_text_cache
+
+CHUNK_INSERT_BATCH = 500
+# How often the parent checks an extraction child's deadlines and memory.
+SANDBOX_POLL_SECONDS = 0.2
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Address space assumed for the interpreter itself when /proc cannot tell us.
+ADDRESS_SPACE_BASELINE_MB = 1024
+# Directory containing the ``backend`` package.
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+
+class ExtractionLimits(NamedTuple):
+    doc_timeout: float = 300.0
+    page_timeout: float = 60.0
+    max_rss_mb: int = 1024
+
+
+class ExtractionFailed(Exception):
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.detail = detail
+
+    def __reduce__(self):
+        # Keep reason and detail intact when raised in an extraction pool worker.
+        return type(self), (self.reason, self.detail)
 
 
 def chunk_streaming(text: str, chunk_size: int, overlap: int, carry: str = "") -> Tuple[List[str], str]:
-    """Split text into chunks with overlap, returning new chunks and carry remainder."""
+    """Split text into chunks with overlap, returning new chunks and carry remainder.
+
+    Walks window offsets over the page instead of re-slicing the remaining buffer,
+    so each page costs O(len(text)); boundaries match the original slicing loop.
+    """
     if chunk_size <= 0:
         raise ValueError("chunk_size must be positive")
     if overlap < 0:
         raise ValueError("overlap cannot be negative")
-    # normalize to utf-8 friendly form, replace surrogates
-    safe_text = (carry + text).encode("utf-8", errors="replace").decode("utf-8", errors="replace")
-    buffer = safe_text
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size")
+    # normalize to utf-8 friendly form, replace surrogates; carry was sanitized on the previous call
+    safe_text = text.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
+    buffer = carry + safe_text if carry else safe_text
     chunks: List[str] = []
-    while len(buffer) >= chunk_size:
-        chunk = buffer[:chunk_size].strip()
+    end = len(buffer) - chunk_size
+    pos = 0
+    while pos <= end:
+        chunk = buffer[pos : pos + chunk_size].strip()
         if chunk:
             chunks.append(chunk)
-        buffer = buffer[chunk_size - overlap :]
-    return chunks, buffer
+        pos += step
+    return chunks, buffer[pos:]
+
 
+def parse_pdf_pages(pdf_path: Path):
+    """Yield text per page straight from pypdf; errors propagate to the caller."""
+    reader = PdfReader(str(pdf_path))
+    for page in reader.pages:
+        txt = page.extract_text() or ""
+        # sanitize to avoid surrogate errors downstream
+        yield txt.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
 
-def extract_pdf_pages(pdf_path: Path):
-    """Yield text per page to avoid loading entire PDF in memory."""
+
+def _statm_mb(pid, field: int) -> Optional[float]:
     try:
-        reader = PdfReader(str(pdf_path))
-        for page in reader.pages:
-            txt = page.extract_text() or ""
-            # sanitize to avoid surrogate errors downstream
-            safe = txt.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
-            yield safe
-    except Exception as exc:  # pypdf can raise various errors; we keep it broad but logged.
-        print(f"[WARN] Failed to parse PDF {pdf_path}: {exc}")
+        with open(f"/proc/{pid}/statm", "r") as f:
+            pages = int(f.read().split()[field])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * _PAGE_SIZE / (1024 * 1024)
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    return _statm_mb(pid, 1)
+
+
+def _cap_address_space(max_rss_mb: int) -> None:
+    """Hard memory cap for the calling process: ``max_rss_mb`` above its current address space.
+
+    The parent's RSS polling can miss a fast allocation spike; with RLIMIT_AS the
+    allocation itself fails with MemoryError. Not enforced on every platform (e.g.
+    macOS), where the polling remains the only guard.
+    """
+    if resource is None:
         return
+    baseline = _statm_mb("self", 0)
+    if baseline is None:
+        baseline = ADDRESS_SPACE_BASELINE_MB
+    limit = int((baseline + max_rss_mb) * 1024 * 1024)
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def _extraction_child(conn, pdf_path: str, max_rss_mb: int):
+    """Entry point of a sandboxed extraction process: stream page texts back over a pipe."""
+    try:
+        _cap_address_space(max_rss_mb)
+        for text in parse_pdf_pages(Path(pdf_path)):
+            conn.send(("page", text))
+        conn.send(("done", None))
+    except MemoryError:
+        conn.send(("memory", f"allocation beyond the {max_rss_mb} MiB address-space cap"))
+    except Exception as exc:
+        conn.send(("error", f"{type(exc).__name__}: {exc}"))
+    finally:
+        conn.close()
+
+
+_rss_warned = False
+
+
+def extract_pdf_pages_isolated(pdf_path: Path, limits: ExtractionLimits, cancel_event=None) -> List[str]:
+    """Parse a PDF in a child process under a wall-clock and memory budget.
+
+    Raises ExtractionFailed when the document or a single page exceeds its timeout,
+    the child's RSS exceeds ``limits.max_rss_mb`` (polled here, and enforced in the
+    child as an address-space limit), or the child errors out or dies. The child is
+    killed on any failure so a pathological file cannot stall the job.
+    """
+    global _rss_warned
+    ctx = _pool_context()
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(
+        target=_extraction_child, args=(send_conn, str(pdf_path), limits.max_rss_mb), daemon=True
+    )
+    proc.start()
+    send_conn.close()
+    pages: List[str] = []
+    started = time.monotonic()
+    last_page = started
+    try:
+        while True:
+            if recv_conn.poll(SANDBOX_POLL_SECONDS):
+                try:
+                    kind, payload = recv_conn.recv()
+                except EOFError:
+                    proc.join(1)
+                    raise ExtractionFailed("crashed", f"exit code {proc.exitcode}") from None
+                if kind == "done":
+                    return pages
+                if kind == "error":
+                    raise ExtractionFailed("error", payload)
+                if kind == "memory":
+                    raise ExtractionFailed("memory", payload)
+                pages.append(payload)
+                last_page = time.monotonic()
+            # Budgets are checked after every message too, so a steady page stream cannot starve them.
+            now = time.monotonic()
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExtractionFailed("cancelled")
+            if now - started > limits.doc_timeout:
+                raise ExtractionFailed("timeout", f"exceeded {limits.doc_timeout:g}s for the document")
+            if now - last_page > limits.page_timeout:
+                raise ExtractionFailed("page_timeout", f"page {len(pages) + 1} exceeded {limits.page_timeout:g}s")
+            rss = _rss_mb(proc.pid)
+            if rss is None and not _rss_warned and proc.is_alive():
+                _rss_warned = True
+                print("[WARN] Cannot read extraction process RSS (no /proc); relying on the address-space limit")
+            if rss is not None and rss > limits.max_rss_mb:
+                raise ExtractionFailed("memory", f"RSS {rss:.0f} MiB exceeded {limits.max_rss_mb} MiB")
+            if not proc.is_alive() and not recv_conn.poll():
+                raise ExtractionFailed("crashed", f"exit code {proc.exitcode}")
+    finally:
+        recv_conn.close()
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+
+
+def extract_pdf_pages(pdf_path: Path, limits: Optional[ExtractionLimits] = None, cancel_event=None):
+    """Yield text per page, served from the extraction cache when the file was seen before.
+
+    With ``limits`` the document is parsed in a sandboxed child process; without it
+    pypdf runs in-process. Either way the whole document is parsed before the first
+    page is yielded and parse errors raise ExtractionFailed, so callers never write
+    chunks of a half-read file. Only fully parsed documents are cached.
+    """
+    cache = get_pdf_text_cache()
+    key = cache.key_for(pdf_path) if cache else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            yield from cached
+            return
+    if limits is not None:
+        pages = extract_pdf_pages_isolated(pdf_path, limits, cancel_event=cancel_event)
+    else:
+        pages = _extract_pdf_pages_inprocess(pdf_path, cancel_event=cancel_event)
+    if key:
+        cache.put(key, pdf_path.stat().st_size, pages)
+    yield from pages
+
+
+def _extract_pdf_pages_inprocess(pdf_path: Path, cancel_event=None) -> List[str]:
+    pages: List[str] = []
+    try:
+        for text in parse_pdf_pages(pdf_path):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExtractionFailed("cancelled")
+            pages.append(text)
+    except ExtractionFailed:
+        raise
+    except Exception as exc:  # pypdf can raise various errors
+        raise ExtractionFailed("error", f"{type(exc).__name__}: {exc}") from exc
+    return pages
 
 
 def hash_chunk(paper_id: int, source_path: str, seq: int, content: str) -> str:
@@ -49,6 +246,151 @@ def hash_chunk(paper_id: int, source_path: str, seq: int, content: str) -> str:
     return h.hexdigest()
 
 
+def load_existing_hashes(session: Session, paper_id: int, source_path: str) -> Set[str]:
+    rows = session.exec(
+        select(Chunk.hash).where(Chunk.paper_id == paper_id, Chunk.source_path == source_path)
+    ).all()
+    return set(rows)
+
+
+def _chunk_insert_stmt(session: Session):
+    # ON CONFLICT (hash) DO NOTHING guards against rows written by a concurrent run.
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_insert(Chunk).on_conflict_do_nothing(index_elements=["hash"])
+    if dialect == "postgresql":
+        return pg_insert(Chunk).on_conflict_do_nothing(index_elements=["hash"])
+    return insert(Chunk)
+
+
+def retire_chunks(session: Session, paper_id: int, source_path: str) -> int:
+    """Delete the chunks of one file and queue their vectors for removal from every collection holding them."""
+    chunk_ids = session.exec(
+        select(Chunk.id).where(Chunk.paper_id == paper_id, Chunk.source_path == source_path)
+    ).all()
+    if not chunk_ids:
+        return 0
+    conn = session.connection()
+    retire_chunk_ids(conn, chunk_ids)
+    # Map-reduce digests are keyed by content, so they would simply miss; drop them to keep the table bounded.
+    conn.execute(delete(GroupDigest).where(GroupDigest.paper_id == paper_id))
+    return len(chunk_ids)
+
+
+class FileFingerprint(NamedTuple):
+    size: int
+    mtime: float
+    sha256: str
+
+
+def file_fingerprint(pdf_path: Path) -> FileFingerprint:
+    st = pdf_path.stat()
+    # The extraction cache already tracks content hashes by (size, mtime); reuse it when enabled.
+    cache = get_pdf_text_cache()
+    sha = cache.key_for(pdf_path) if cache else None
+    return FileFingerprint(st.st_size, st.st_mtime, sha or file_sha256(pdf_path))
+
+
+def record_fingerprint(session: Session, paper_id: int, source_path: str, fingerprint: FileFingerprint) -> None:
+    session.connection().execute(
+        update(FileAttachment)
+        .where(FileAttachment.paper_id == paper_id, FileAttachment.path == source_path)
+        .values(
+            fingerprint_size=fingerprint.size,
+            fingerprint_mtime=fingerprint.mtime,
+            fingerprint_sha256=fingerprint.sha256,
+            chunked_at=datetime.utcnow(),
+        )
+    )
+
+
+class ChunkWriter:
+    """Buffer the chunks of one (paper_id, source_path) and insert them in batches.
+
+    Existing hashes are loaded once up front, so re-runs skip known chunks without
+    a per-chunk lookup; new rows go out as a single executemany per batch.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        paper_id: int,
+        source_path: str,
+        batch_size: int = CHUNK_INSERT_BATCH,
+        replace: bool = False,
+    ):
+        self.session = session
+        self.paper_id = paper_id
+        self.source_path = source_path
+        self.batch_size = batch_size
+        # Old rows of a replaced file are retired lazily, when the first new chunk
+        # arrives, so a failed or empty extraction leaves the previous chunks in place.
+        self.replace = replace
+        self.existing = set() if replace else load_existing_hashes(session, paper_id, source_path)
+        self.pending: List[Dict] = []
+        self.inserted = 0
+        self.skipped = 0
+        self.fts = fts_enabled(session.get_bind())
+
+    def _retire_old_chunks(self):
+        if self.replace:
+            self.replace = False
+            retire_chunks(self.session, self.paper_id, self.source_path)
+
+    def add(self, seq: int, chunk: str):
+        self._retire_old_chunks()
+        chunk_hash = hash_chunk(self.paper_id, self.source_path, seq, chunk)
+        if chunk_hash in self.existing:
+            self.skipped += 1
+            return
+        self.existing.add(chunk_hash)
+        self.pending.append(
+            {
+                "paper_id": self.paper_id,
+                "source_path": self.source_path,
+                "seq": seq,
+                "hash": chunk_hash,
+                "content": chunk,
+                "text_length": len(chunk),
+                "created_at": datetime.utcnow(),
+            }
+        )
+        self.inserted += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        conn = self.session.connection()
+        stmt = _chunk_insert_stmt(self.session)
+        if self.fts:
+            # RETURNING yields only the rows actually inserted, so conflicts are not indexed twice.
+            index_chunks(conn, conn.execute(stmt.returning(Chunk.id, Chunk.paper_id, Chunk.content), self.pending).all())
+        else:
+            conn.execute(stmt, self.pending)
+        self.pending = []
+
+
+def store_chunks(
+    session: Session,
+    paper_id: int,
+    source_path: str,
+    chunks: List[str],
+    start_seq: int = 0,
+    stop_event=None,
+    replace: bool = False,
+) -> Tuple[int, int]:
+    """Write already-extracted chunks in order; used by the parallel path."""
+    writer = ChunkWriter(session, paper_id, source_path, replace=replace)
+    for offset, chunk in enumerate(chunks):
+        if stop_event and stop_event.is_set():
+            break
+        writer.add(start_seq + offset, chunk)
+    writer.flush()
+    return writer.inserted, writer.skipped
+
+
 def process_pdf_for_paper(
     session: Session,
     paper: Paper,
@@ -57,53 +399,357 @@ def process_pdf_for_paper(
     overlap: int,
     start_seq: int = 0,
     stop_event=None,
+    limits: Optional[ExtractionLimits] = None,
+    replace: bool = False,
 ) -> Tuple[int, int]:
-    inserted = 0
-    skipped = 0
+    writer = ChunkWriter(session, paper.id, str(pdf_path), replace=replace)
     carry = ""
     seq = start_seq
-    for page_text in extract_pdf_pages(pdf_path):
+    for page_text in extract_pdf_pages(pdf_path, limits=limits, cancel_event=stop_event):
         if stop_event and stop_event.is_set():
             break
         new_chunks, carry = chunk_streaming(page_text, chunk_size=chunk_size, overlap=overlap, carry=carry)
         for chunk in new_chunks:
             if stop_event and stop_event.is_set():
                 break
-            chunk_hash = hash_chunk(paper.id, str(pdf_path), seq, chunk)
-            exists = session.exec(select(Chunk).where(Chunk.hash == chunk_hash)).first()
-            if exists:
-                skipped += 1
-            else:
-                rec = Chunk(
-                    paper_id=paper.id,
-                    source_path=str(pdf_path),
-                    seq=seq,
-                    hash=chunk_hash,
-                    content=chunk,
-                    text_length=len(chunk),
-                )
-                session.add(rec)
-                inserted += 1
+            writer.add(seq, chunk)
             seq += 1
     # flush remaining carry
     if carry.strip():
-        chunk = carry.strip()
-        chunk_hash = hash_chunk(paper.id, str(pdf_path), seq, chunk)
-        exists = session.exec(select(Chunk).where(Chunk.hash == chunk_hash)).first()
-        if exists:
-            skipped += 1
+        writer.add(seq, carry.strip())
+    writer.flush()
+    return writer.inserted, writer.skipped
+
+
+def extract_pdf_chunks(
+    pdf_path: str,
+    chunk_size: int,
+    overlap: int,
+    limits: Optional[ExtractionLimits] = None,
+    cancel_event=None,
+) -> List[str]:
+    """Extract and chunk one PDF without touching the DB; runs in the extractor's pool."""
+    path = Path(pdf_path)
+    if not path.exists():
+        return []
+    chunks: List[str] = []
+    carry = ""
+    for page_text in extract_pdf_pages(path, limits=limits, cancel_event=cancel_event):
+        new_chunks, carry = chunk_streaming(page_text, chunk_size=chunk_size, overlap=overlap, carry=carry)
+        chunks.extend(new_chunks)
+    if carry.strip():
+        chunks.append(carry.strip())
+    return chunks
+
+
+def _pool_context():
+    # forkserver avoids forking the multi-threaded API process; spawn elsewhere.
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" not in methods:
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    # The fork server is a fresh interpreter that ignores our sys.path, so a preload of
+    # this module only succeeds when the project root is importable from its environment.
+    # Otherwise the preload fails silently and every sandbox re-imports SQLAlchemy and pypdf.
+    search_path = os.environ.get("PYTHONPATH", "").split(os.pathsep)
+    if PROJECT_ROOT not in search_path:
+        os.environ["PYTHONPATH"] = os.pathsep.join([PROJECT_ROOT, *filter(None, search_path)])
+    # Preload pypdf and this module in the fork server so each sandbox starts warm.
+    ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+class ParallelExtractor:
+    """Run extractions concurrently and hand the results back in submission order.
+
+    With ``limits`` each document is parsed in its own sandboxed child process (see
+    extract_pdf_pages_isolated) and threads only wait on those children and chunk
+    the returned text. Without ``limits`` there is no sandbox, so parsing and
+    chunking run in a process pool instead, out of reach of the GIL. At most
+    ``workers * 2`` documents are in flight so memory stays bounded while the single
+    writer in ``ingest_pdfs`` drains results.
+    """
+
+    def __init__(
+        self,
+        pdf_paths: Iterable[Path],
+        workers: int,
+        chunk_size: int,
+        overlap: int,
+        limits: Optional[ExtractionLimits],
+    ):
+        self._queue = iter(pdf_paths)
+        self._inflight: deque = deque()
+        self._window = max(1, workers) * 2
+        self._chunk_size = chunk_size
+        self._overlap = overlap
+        self._limits = limits
+        if limits is None:
+            # A threading.Event cannot reach pool processes; close() cancels queued work instead.
+            self._closing = None
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
         else:
-            rec = Chunk(
-                paper_id=paper.id,
-                source_path=str(pdf_path),
-                seq=seq,
-                hash=chunk_hash,
-                content=chunk,
-                text_length=len(chunk),
+            self._closing = threading.Event()
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-extract")
+        self._fill()
+
+    def _fill(self):
+        while len(self._inflight) < self._window:
+            path = next(self._queue, None)
+            if path is None:
+                return
+            future: Future = self._pool.submit(
+                extract_pdf_chunks, str(path), self._chunk_size, self._overlap, self._limits, self._closing
+            )
+            self._inflight.append((path, future))
+
+    def take(self, pdf_path: Path) -> List[str]:
+        """Return the chunks for the next planned PDF; re-raises ExtractionFailed."""
+        path, future = self._inflight.popleft()
+        if path != pdf_path:
+            raise RuntimeError(f"Out-of-order extraction result: expected {pdf_path}, got {path}")
+        self._fill()
+        return future.result()
+
+    def close(self):
+        self._queue = iter(())
+        if self._closing is not None:
+            self._closing.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def load_quarantined_paths(session: Session) -> Set[str]:
+    """Quarantined paths whose file is unchanged since it was quarantined."""
+    skipped: Set[str] = set()
+    for row in session.exec(select(QuarantinedFile)).all():
+        try:
+            st = Path(row.path).stat()
+        except OSError:
+            skipped.add(row.path)
+            continue
+        if row.file_size == st.st_size and row.file_mtime == st.st_mtime:
+            skipped.add(row.path)
+    return skipped
+
+
+def quarantine_file(session: Session, pdf_path: Path, failure: ExtractionFailed) -> None:
+    try:
+        st = pdf_path.stat()
+        size, mtime = st.st_size, st.st_mtime
+    except OSError:
+        size, mtime = None, None
+    row = session.exec(select(QuarantinedFile).where(QuarantinedFile.path == str(pdf_path))).first()
+    if row:
+        row.attempts += 1
+    else:
+        row = QuarantinedFile(path=str(pdf_path))
+    row.reason = failure.reason
+    row.detail = failure.detail
+    row.file_size = size
+    row.file_mtime = mtime
+    row.updated_at = datetime.utcnow()
+    session.add(row)
+
+
+PLAN_PAGE_PAPERS = 500
+
+
+def _papers_in_scope(limit_papers: Optional[int]):
+    stmt = select(Paper.id).where(Paper.is_paper == True).order_by(Paper.id)
+    if limit_papers:
+        stmt = stmt.limit(limit_papers)
+    return stmt.subquery()
+
+
+def load_chunked_pairs(session: Session, scope) -> Set[Tuple[int, str]]:
+    """All (paper_id, source_path) pairs in scope that already have chunks, in one query."""
+    rows = session.exec(
+        select(Chunk.paper_id, Chunk.source_path)
+        .where(Chunk.paper_id.in_(select(scope.c.id)))
+        .distinct()
+    ).all()
+    return {(paper_id, source_path) for paper_id, source_path in rows}
+
+
+class PlannedPdf(NamedTuple):
+    path: Path
+    replace: bool = False  # previously chunked file whose content changed
+
+
+class _PlannedPaper(NamedTuple):
+    id: int
+    title: Optional[str]
+
+
+def _check_chunked_file(
+    session: Session,
+    paper_id: int,
+    path: str,
+    fp_size: Optional[int],
+    fp_mtime: Optional[float],
+    fp_sha: Optional[str],
+) -> bool:
+    """Return True when a chunked file changed since it was fingerprinted.
+
+    Unchanged size/mtime is trusted without hashing. Files chunked before fingerprints
+    existed are adopted as-is, and touched-but-identical files only get their stat
+    fields refreshed, so neither is re-chunked.
+    """
+    pdf_path = Path(path)
+    try:
+        st = pdf_path.stat()
+    except OSError:
+        return False  # keep existing chunks of files that went missing
+    if fp_sha is not None and fp_size == st.st_size and fp_mtime == st.st_mtime:
+        return False
+    fingerprint = file_fingerprint(pdf_path)
+    if fp_sha is None or fingerprint.sha256 == fp_sha:
+        record_fingerprint(session, paper_id, path, fingerprint)
+        return False
+    return True
+
+
+def iter_pdf_plan(
+    session: Session,
+    scope,
+    chunked: Set[Tuple[int, str]],
+    quarantined: Set[str] = frozenset(),
+):
+    """Yield (paper, [PlannedPdf]) per paper, paging through the scope by paper id.
+
+    Each page is one join of papers and their PDF attachments, so work can start
+    after the first page instead of after a full scan of the library. Already
+    chunked files are only planned again when their fingerprint changed.
+    """
+    last_id = 0
+    while True:
+        rows = session.exec(
+            select(
+                Paper.id,
+                Paper.title,
+                FileAttachment.path,
+                FileAttachment.fingerprint_size,
+                FileAttachment.fingerprint_mtime,
+                FileAttachment.fingerprint_sha256,
+            )
+            .join(FileAttachment, FileAttachment.paper_id == Paper.id)
+            .where(
+                Paper.id.in_(
+                    select(scope.c.id).where(scope.c.id > last_id).order_by(scope.c.id).limit(PLAN_PAGE_PAPERS)
+                ),
+                FileAttachment.path.ilike("%.pdf"),
             )
-            session.add(rec)
-            inserted += 1
-    return inserted, skipped
+            .order_by(Paper.id, FileAttachment.id)
+        ).all()
+        if not rows:
+            return
+        current = None
+        planned: List[PlannedPdf] = []
+        seen: Set[str] = set()
+        for paper_id, title, path, fp_size, fp_mtime, fp_sha in rows:
+            if current is None or current.id != paper_id:
+                if current is not None and planned:
+                    yield current, planned
+                current = _PlannedPaper(paper_id, title)
+                planned = []
+                seen = set()
+            if path in seen or path in quarantined:
+                continue
+            seen.add(path)
+            if (paper_id, path) not in chunked:
+                planned.append(PlannedPdf(Path(path)))
+            elif _check_chunked_file(session, paper_id, path, fp_size, fp_mtime, fp_sha):
+                planned.append(PlannedPdf(Path(path), replace=True))
+        if current is not None and planned:
+            yield current, planned
+        last_id = rows[-1][0]
+
+
+class PlanTotals:
+    """Compute job totals with aggregate queries on a background thread.
+
+    Processing starts immediately; progress events carry the totals once known.
+    Chunks written by this job after ``watermark`` are ignored so the counts
+    describe the plan as it was when the job started.
+    """
+
+    def __init__(self, engine, scope, skip_existing: bool, watermark: int, quarantined: Set[str] = frozenset()):
+        self.values: Dict[str, int] = {}
+        self._thread = threading.Thread(
+            target=self._compute, args=(engine, scope, skip_existing, watermark, quarantined), daemon=True
+        )
+        self._thread.start()
+
+    def _compute(self, engine, scope, skip_existing: bool, watermark: int, quarantined: Set[str]):
+        with Session(engine) as session:
+            pdfs = select(FileAttachment.paper_id, FileAttachment.path).where(
+                FileAttachment.paper_id.in_(select(scope.c.id)),
+                FileAttachment.path.ilike("%.pdf"),
+            )
+            all_pdfs = session.exec(select(func.count()).select_from(pdfs.subquery())).one()
+            pending = pdfs
+            if skip_existing:
+                pending = pdfs.where(
+                    ~exists().where(
+                        Chunk.paper_id == FileAttachment.paper_id,
+                        Chunk.source_path == FileAttachment.path,
+                        Chunk.id <= watermark,
+                    )
+                )
+            unquarantined = pending
+            if quarantined:
+                unquarantined = pending.where(FileAttachment.path.notin_(sorted(quarantined)))
+            pending_count = session.exec(select(func.count()).select_from(pending.subquery())).one()
+            pending_sq = unquarantined.subquery()
+            total_pdfs, total_papers = session.exec(
+                select(func.count(), func.count(distinct(pending_sq.c.paper_id)))
+            ).one()
+            changed = 0
+            if skip_existing:
+                changed = self._count_changed(session, pdfs, watermark, quarantined)
+        self.values = {
+            "total_pdfs": total_pdfs + changed,
+            "total_papers": total_papers,
+            "skipped_existing": all_pdfs - pending_count - changed,
+            "skipped_quarantined": pending_count - total_pdfs,
+        }
+
+    @staticmethod
+    def _count_changed(session: Session, pdfs, watermark: int, quarantined: Set[str]) -> int:
+        """Fingerprinted files whose size or mtime moved; an upper bound on re-chunks."""
+        rows = session.exec(
+            pdfs.with_only_columns(
+                FileAttachment.path, FileAttachment.fingerprint_size, FileAttachment.fingerprint_mtime
+            ).where(
+                FileAttachment.fingerprint_sha256.is_not(None),
+                exists().where(
+                    Chunk.paper_id == FileAttachment.paper_id,
+                    Chunk.source_path == FileAttachment.path,
+                    Chunk.id <= watermark,
+                ),
+            )
+        ).all()
+        changed = 0
+        for path, size, mtime in rows:
+            if path in quarantined:
+                continue
+            try:
+                st = Path(path).stat()
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                changed += 1
+        return changed
+
+    def snapshot(self) -> Dict[str, int]:
+        values = self.values
+        if not values:
+            return {}
+        return {"total_pdfs": values["total_pdfs"], "total_papers": values["total_papers"]}
+
+    def wait(self) -> Dict[str, int]:
+        self._thread.join()
+        return self.values
 
 
 def ingest_pdfs(
@@ -113,134 +759,182 @@ def ingest_pdfs(
     progress_cb: Optional[Callable[[Dict], None]] = None,
     skip_existing: bool = True,
     stop_event=None,
+    workers: int = 1,
+    limits: Optional[ExtractionLimits] = None,
+    retry_quarantined: bool = False,
+    sandbox: bool = True,
 ):
+    """Chunk the PDF attachments of papers in scope into the database.
+
+    By default every PDF is parsed in its own sandboxed child process under
+    ``limits`` (defaults from ExtractionLimits), even with ``workers=1``, so a
+    pathological file is killed and quarantined rather than hanging the job.
+    ``sandbox=False`` parses in-process instead: no process start-up cost, but no
+    timeouts or memory cap; files pypdf fails on are still quarantined.
+    """
+    limits = (limits or ExtractionLimits()) if sandbox else None
     engine = create_db_engine()
     init_db(engine)
     with Session(engine) as session:
-        papers_query = select(Paper).where(Paper.is_paper == True).order_by(Paper.id)
-        if limit_papers:
-            papers_query = papers_query.limit(limit_papers)
-        papers = session.exec(papers_query).all()
-
-        # 预扫描，先确定总数，避免进度条不断变化
-        paper_pdf_list = []
-        total_pdfs = 0
-        total_papers_with_pdf = 0
-        total_skipped_existing = 0
-        for paper in papers:
-            attachments = session.exec(
-                select(FileAttachment).where(FileAttachment.paper_id == paper.id)
-            ).all()
-            pdf_paths = [
-                Path(att.path)
-                for att in attachments
-                if att.path and att.path.lower().endswith(".pdf")
-            ]
-            if not pdf_paths:
-                continue
-            valid_paths = []
-            for p in pdf_paths:
-                if skip_existing:
-                    exists_chunk = session.exec(
-                        select(Chunk.id).where(
-                            Chunk.paper_id == paper.id,
-                            Chunk.source_path == str(p),
-                        )
-                    ).first()
-                    if exists_chunk:
-                        total_skipped_existing += 1
-                        continue
-                valid_paths.append(p)
-            if not valid_paths:
-                continue
-            paper_pdf_list.append((paper, valid_paths))
-            total_pdfs += len(valid_paths)
-            total_papers_with_pdf += 1
+        scope = _papers_in_scope(limit_papers)
+        chunked = load_chunked_pairs(session, scope) if skip_existing else set()
+        quarantined_paths = set() if retry_quarantined else load_quarantined_paths(session)
+        watermark = session.exec(select(func.max(Chunk.id))).one() or 0
+        totals = PlanTotals(engine, scope, skip_existing, watermark, quarantined_paths)
+        if progress_cb:
+            progress_cb({"stage": "planning", "processed_pdfs": 0})
 
         total_inserted = 0
         total_skipped = 0
         processed_pdfs = 0
         missing_files = 0
+        quarantined = 0
+        rechunked = 0
 
-        for paper, pdf_paths in paper_pdf_list:
-            if stop_event and stop_event.is_set():
-                if progress_cb:
-                    progress_cb({"stage": "stopped", "processed_pdfs": processed_pdfs, "total_pdfs": total_pdfs})
-                break
-            if progress_cb:
-                progress_cb(
-                    {
-                        "paper_id": paper.id,
-                        "paper_title": paper.title,
-                        "stage": "start_paper",
-                        "total_papers": total_papers_with_pdf,
-                        "total_pdfs": total_pdfs,
-                        "chunks_inserted": total_inserted,
-                        "chunks_skipped": total_skipped,
-                        "processed_pdfs": processed_pdfs,
-                    }
-                )
-            for pdf_path in pdf_paths:
+        plan = iter_pdf_plan(session, scope, chunked, quarantined_paths)
+        extractor = None
+        if workers > 1:
+            # The extractor reads ahead of the writer through its own view of the plan.
+            plan, lookahead = itertools.tee(plan)
+            extractor = ParallelExtractor(
+                (item.path for _, items in lookahead for item in items), workers, chunk_size, overlap, limits
+            )
+        try:
+            for paper, planned in plan:
                 if stop_event and stop_event.is_set():
+                    if progress_cb:
+                        progress_cb({"stage": "stopped", "processed_pdfs": processed_pdfs, **totals.snapshot()})
                     break
-                if not pdf_path.exists():
-                    print(f"[WARN] File not found: {pdf_path}")
-                    missing_files += 1
+                if progress_cb:
+                    progress_cb(
+                        {
+                            "paper_id": paper.id,
+                            "paper_title": paper.title,
+                            "stage": "start_paper",
+                            **totals.snapshot(),
+                            "chunks_inserted": total_inserted,
+                            "chunks_skipped": total_skipped,
+                            "processed_pdfs": processed_pdfs,
+                        }
+                    )
+                for pdf_path, replace in planned:
+                    if stop_event and stop_event.is_set():
+                        break
+                    if not pdf_path.exists():
+                        print(f"[WARN] File not found: {pdf_path}")
+                        if extractor:
+                            extractor.take(pdf_path)
+                        missing_files += 1
+                        processed_pdfs += 1
+                        if progress_cb:
+                            progress_cb(
+                                {
+                                    "stage": "file_missing",
+                                    "path": str(pdf_path),
+                                    "processed_pdfs": processed_pdfs,
+                                    **totals.snapshot(),
+                                    "missing_files": missing_files,
+                                }
+                            )
+                        continue
+                    if progress_cb:
+                        progress_cb(
+                            {
+                                "stage": "start_pdf",
+                                "path": str(pdf_path),
+                                "processed_pdfs": processed_pdfs,
+                                **totals.snapshot(),
+                            }
+                        )
+                    try:
+                        if extractor:
+                            inserted, skipped = store_chunks(
+                                session,
+                                paper.id,
+                                str(pdf_path),
+                                extractor.take(pdf_path),
+                                stop_event=stop_event,
+                                replace=replace,
+                            )
+                        else:
+                            inserted, skipped = process_pdf_for_paper(
+                                session,
+                                paper,
+                                pdf_path,
+                                chunk_size,
+                                overlap,
+                                stop_event=stop_event,
+                                limits=limits,
+                                replace=replace,
+                            )
+                    except ExtractionFailed as failure:
+                        if failure.reason == "cancelled":
+                            break
+                        print(f"[WARN] Quarantined PDF {pdf_path}: {failure}")
+                        quarantine_file(session, pdf_path, failure)
+                        quarantined += 1
+                        processed_pdfs += 1
+                        if progress_cb:
+                            progress_cb(
+                                {
+                                    "stage": "quarantined",
+                                    "path": str(pdf_path),
+                                    "error": str(failure),
+                                    "processed_pdfs": processed_pdfs,
+                                    **totals.snapshot(),
+                                    "quarantined": quarantined,
+                                }
+                            )
+                        continue
+                    if stop_event and stop_event.is_set():
+                        break
+                    record_fingerprint(session, paper.id, str(pdf_path), file_fingerprint(pdf_path))
+                    total_inserted += inserted
+                    total_skipped += skipped
                     processed_pdfs += 1
+                    rechunked += int(replace)
                     if progress_cb:
                         progress_cb(
                             {
-                                "stage": "file_missing",
+                                "stage": "done_pdf",
                                 "path": str(pdf_path),
                                 "processed_pdfs": processed_pdfs,
-                                "total_pdfs": total_pdfs,
+                                **totals.snapshot(),
+                                "chunks_inserted": total_inserted,
+                                "chunks_skipped": total_skipped,
                                 "missing_files": missing_files,
+                                "rechunked": rechunked,
                             }
                         )
-                    continue
-                if progress_cb:
-                    progress_cb(
-                        {
-                            "stage": "start_pdf",
-                            "path": str(pdf_path),
-                            "processed_pdfs": processed_pdfs,
-                            "total_pdfs": total_pdfs,
-                        }
-                    )
-                inserted, skipped = process_pdf_for_paper(
-                    session, paper, pdf_path, chunk_size, overlap, stop_event=stop_event
-                )
-                total_inserted += inserted
-                total_skipped += skipped
-                processed_pdfs += 1
+                if stop_event and stop_event.is_set():
+                    # Drop the interrupted paper so no file is left half-chunked or half-replaced.
+                    session.rollback()
+                    if progress_cb:
+                        progress_cb({"stage": "stopped", "processed_pdfs": processed_pdfs, **totals.snapshot()})
+                    break
+                session.commit()
                 if progress_cb:
                     progress_cb(
                         {
-                            "stage": "done_pdf",
-                            "path": str(pdf_path),
-                            "processed_pdfs": processed_pdfs,
-                            "total_pdfs": total_pdfs,
+                            "stage": "done_paper",
+                            "paper_id": paper.id,
                             "chunks_inserted": total_inserted,
                             "chunks_skipped": total_skipped,
+                            "processed_pdfs": processed_pdfs,
+                            **totals.snapshot(),
                             "missing_files": missing_files,
                         }
                     )
-            session.commit()
-            if progress_cb:
-                progress_cb(
-                    {
-                        "stage": "done_paper",
-                        "paper_id": paper.id,
-                        "chunks_inserted": total_inserted,
-                        "chunks_skipped": total_skipped,
-                        "processed_pdfs": processed_pdfs,
-                        "total_pdfs": total_pdfs,
-                        "missing_files": missing_files,
-                    }
-                )
+        finally:
+            if extractor:
+                extractor.close()
 
+    final_totals = totals.wait()
+    total_pdfs = final_totals["total_pdfs"]
+    total_papers_with_pdf = final_totals["total_papers"]
+    total_skipped_existing = final_totals["skipped_existing"]
     print(
-        f"PDF processing done. papers_with_pdf={total_papers_with_pdf}, chunks_inserted={total_inserted}, skipped_existing_chunks={total_skipped}, skipped_files_existing={total_skipped_existing}"
+        f"PDF processing done. papers_with_pdf={total_papers_with_pdf}, chunks_inserted={total_inserted}, skipped_existing_chunks={total_skipped}, skipped_files_existing={total_skipped_existing}, rechunked={rechunked}, quarantined={quarantined}"
     )
     if progress_cb:
         progress_cb(
@@ -252,7 +946,10 @@ def ingest_pdfs(
                 "total_pdfs": total_pdfs,
                 "processed_pdfs": processed_pdfs,
                 "skipped_existing_files": total_skipped_existing,
+                "skipped_quarantined_files": final_totals["skipped_quarantined"],
                 "missing_files": missing_files,
+                "rechunked": rechunked,
+                "quarantined": quarantined,
             }
         )
 
@@ -262,11 +959,29 @@ def main():
     parser.add_argument("--limit-papers", type=int, default=None, help="Limit number of papers to process.")
     parser.add_argument("--chunk-size", type=int, default=1200, help="Chunk size (characters).")
     parser.add_argument("--overlap", type=int, default=200, help="Overlap between chunks (characters).")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="PDFs extracted concurrently, each in its own process."
+    )
+    parser.add_argument("--doc-timeout", type=float, default=300.0, help="Seconds allowed per PDF.")
+    parser.add_argument("--page-timeout", type=float, default=60.0, help="Seconds allowed per page.")
+    parser.add_argument("--max-rss-mb", type=int, default=1024, help="Memory cap for an extraction process.")
+    parser.add_argument(
+        "--retry-quarantined", action="store_true", help="Retry PDFs quarantined by earlier runs."
+    )
+    parser.add_argument(
+        "--no-sandbox",
+        action="store_true",
+        help="Parse PDFs in-process: faster, but without timeouts or memory cap.",
+    )
     args = parser.parse_args()
     ingest_pdfs(
         limit_papers=args.limit_papers,
         chunk_size=args.chunk_size,
         overlap=args.overlap,
+        workers=args.workers,
+        limits=ExtractionLimits(args.doc_timeout, args.page_timeout, args.max_rss_mb),
+        retry_quarantined=args.retry_quarantined,
+        sandbox=not args.no_sandbox,
     )
 
 
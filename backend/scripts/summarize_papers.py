@@ -3,12 +3,12 @@ import json
 import os
 from typing import Dict, List, Optional, Tuple
 
-import httpx
 from sqlalchemy import func
 from sqlmodel import Session, select
 
 from backend.app.db import create_db_engine, init_db
 from backend.app.models import Chunk, Paper, Summary, Tag
+from backend.app.services.model_client import CircuitOpenError, RequestStopped, post_json
 
 
 def get_llm_config() -> Dict[str, str]:
@@ -64,7 +64,7 @@ Excerpts:
 """
 
 
-def call_llm(prompt: str, cfg: Dict[str, str]) -> Dict[str, any]:
+def call_llm(prompt: str, cfg: Dict[str, str], stop_event=None) -> Dict[str, any]:
     url = cfg["base_url"].rstrip("/") + "/chat/completions"
     headers = {"Authorization": f"Bearer {cfg['api_key']}", "Content-Type": "application/json"}
     payload = {
@@ -74,8 +74,7 @@ def call_llm(prompt: str, cfg: Dict[str, str]) -> Dict[str, any]:
         # Hint the API to return a JSON object if supported (OpenAI-style).
         "response_format": {"type": "json_object"},
     }
-    resp = httpx.post(url, headers=headers, json=payload, timeout=120)
-    resp.raise_for_status()
+    resp = post_json(url, headers, payload, timeout=120, stop_event=stop_event)
     try:
         data = resp.json()
     except Exception:
@@ -218,7 +217,10 @@ def process_papers(
             context = fetch_context(session, paper.id, chunk_chars)
             prompt = build_prompt(paper.title or "(untitled)", abstract, context)
             try:
-                result = call_llm(prompt, cfg)
+                result = call_llm(prompt, cfg, stop_event=stop_event)
+            except RequestStopped:
+                # Picked up by the stop check at the top of the loop.
+                continue
             except Exception as exc:
                 print(f"[ERROR] LLM call failed for paper {paper.id} ({paper.title}): {exc}")
                 errors += 1
@@ -238,6 +240,9 @@ def process_papers(
                             "current_paper_title": paper.title,
                         }
                     )
+                if isinstance(exc, CircuitOpenError):
+                    # The endpoint stayed down through the retry budget; stop instead of failing every paper.
+                    break
                 continue
             if dry_run:
                 print(json.dumps({"paper_id": paper.id, "title": paper.title, "result": result}, ensure_ascii=False))
@@ -58,21 +58,64 @@ export async function updateConfig(
   return data.entries;
 }
 
-export async function chatWithPaper(
+export interface ChatStreamHandlers {
+  onContexts?: (contexts: any[]) => void;
+  onDelta?: (text: string) => void;
+}
+
+export async function chatWithPaperStream(
   settings: Settings,
-  payload: { query: string; paper_id?: number; top_k?: number; use_embeddings?: boolean; send_full_text?: boolean; max_chunks?: number },
+  payload: { query: string; paper_id?: number; top_k?: number; use_embeddings?: boolean; send_full_text?: boolean; max_chunks?: number; map_reduce?: boolean },
+  handlers: ChatStreamHandlers,
+  signal?: AbortSignal,
 ): Promise<{ answer: string; contexts: any[] }> {
-  const url = buildUrl(settings.apiBase, "/chat");
+  const url = buildUrl(settings.apiBase, "/chat/stream");
   const res = await fetch(url, {
     method: "POST",
-    headers: { "Content-Type": "application/json", Accept: "application/json" },
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
     body: JSON.stringify(payload),
+    signal,
   });
-  if (!res.ok) {
+  if (!res.ok || !res.body) {
     const text = await res.text();
     throw new Error(`Chat failed (${res.status}): ${text}`);
   }
-  return res.json();
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+  let contexts: any[] = [];
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep = buffer.indexOf("\n\n");
+    while (sep !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      sep = buffer.indexOf("\n\n");
+      let event = "message";
+      let data = "";
+      block.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const parsed = JSON.parse(data);
+      if (event === "contexts") {
+        contexts = parsed.contexts || [];
+        handlers.onContexts?.(contexts);
+      } else if (event === "delta") {
+        answer += parsed.text;
+        handlers.onDelta?.(parsed.text);
+      } else if (event === "done") {
+        answer = parsed.answer ?? answer;
+      } else if (event === "error") {
+        throw new Error(`Chat failed (${parsed.status}): ${parsed.detail}`);
+      }
+    }
+  }
+  return { answer, contexts };
 }
 
 export async function uploadCsv(
@@ -99,7 +142,7 @@ export async function uploadCsv(
 
 export async function runProcessPdfs(
   settings: Settings,
-  params: { chunk_size?: number; overlap?: number; limit?: number; skip_existing?: boolean },
+  params: { chunk_size?: number; overlap?: number; limit?: number; skip_existing?: boolean; workers?: number },
 ): Promise<{ job_id: string }> {
   const url = buildUrl(settings.apiBase, "/pipeline/process_pdfs/start");
   const res = await fetch(url, {
@@ -1,5 +1,5 @@
 import React, { useState } from "react";
-import { chatWithPaper } from "../api";
+import { chatWithPaperStream } from "../api";
 import { PaperDetail, Settings } from "../types";
 
 interface Props {
@@ -19,6 +19,7 @@ export const ChatPanel: React.FC<Props> = ({ paper, settings }) => {
   const [loading, setLoading] = useState(false);
   const [useEmbeddings, setUseEmbeddings] = useState(false);
   const [sendFullText, setSendFullText] = useState(false);
+  const [mapReduce, setMapReduce] = useState(false);
   const [maxChunks, setMaxChunks] = useState(4);
   const disabled = !paper;
 
@@ -30,15 +31,29 @@ export const ChatPanel: React.FC<Props> = ({ paper, settings }) => {
     setInput("");
     setMessages((prev) => [...prev, { role: "user", content: prompt }]);
     setLoading(true);
-    try {
-      const resp = await chatWithPaper(settings, {
-        query: prompt,
-        paper_id: paper?.id,
-        top_k: 4,
-        use_embeddings: useEmbeddings,
-        send_full_text: sendFullText,
-        max_chunks: sendFullText ? undefined : maxChunks,
+    // Placeholder assistant message that streamed tokens are appended to.
+    setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+    const updateAnswer = (update: (content: string) => string) =>
+      setMessages((prev) => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        next[next.length - 1] = { ...last, content: update(last.content) };
+        return next;
       });
+    try {
+      const resp = await chatWithPaperStream(
+        settings,
+        {
+          query: prompt,
+          paper_id: paper?.id,
+          top_k: 4,
+          use_embeddings: useEmbeddings,
+          send_full_text: sendFullText,
+          max_chunks: sendFullText ? undefined : maxChunks,
+          map_reduce: sendFullText && mapReduce,
+        },
+        { onDelta: (text) => updateAnswer((content) => content + text) },
+      );
       // Generate concise context summary
       let ctxSummary = "";
       if (resp.contexts && resp.contexts.length > 0) {
@@ -55,11 +70,10 @@ export const ChatPanel: React.FC<Props> = ({ paper, settings }) => {
           ctxSummary = `${count} chunks (seq ${firstSeq}-${lastSeq})`;
         }
       }
-      setMessages((prev) => [
-        ...prev,
-        { role: "assistant", content: resp.answer + (ctxSummary ? `\n\n(Context: ${ctxSummary})` : "") },
-      ]);
+      updateAnswer(() => resp.answer + (ctxSummary ? `\n\n(Context: ${ctxSummary})` : ""));
     } catch (err) {
+      // Drop the placeholder if the stream failed before any token arrived.
+      setMessages((prev) => (prev[prev.length - 1]?.content ? prev : prev.slice(0, -1)));
       setError(err instanceof Error ? err.message : "Chat failed");
     } finally {
       setLoading(false);
@@ -103,6 +117,21 @@ export const ChatPanel: React.FC<Props> = ({ paper, settings }) => {
         </label>
         <span className="muted">Send all chunks from the paper (may be very long)</span>
 
+        {sendFullText && (
+          <>
+            <label className="checkbox-label" style={{ marginTop: "8px" }}>
+              <input
+                type="checkbox"
+                checked={mapReduce}
+                onChange={(e) => setMapReduce(e.target.checked)}
+                disabled={disabled || loading}
+              />
+              <span>Condense first (map-reduce)</span>
+            </label>
+            <span className="muted">Summarize the paper in parallel sections, then answer; section summaries are reused</span>
+          </>
+        )}
+
         {!sendFullText && (
           <div style={{ marginTop: "12px" }}>
             <label style={{ display: "flex", alignItems: "center", gap: "8px" }}>
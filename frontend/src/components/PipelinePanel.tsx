@@ -31,6 +31,7 @@ type PipelineStats = {
   missing_summary: number;
   chunks_total?: number;
   embed_estimate?: { persist_dir: string; collection: string; embedded_count: number } | null;
+  embedded_by_model?: { model: string; collection: string; embedded: number }[];
 };
 
 export const PipelinePanel: React.FC<Props> = ({ settings, onSummaryFinished }) => {
@@ -558,6 +559,12 @@ export const PipelinePanel: React.FC<Props> = ({ settings, onSummaryFinished })
                   <span>{stats.embed_estimate.embedded_count}/{stats.chunks_total ?? "?"}</span>
                 </div>
               )}
+              {stats.embedded_by_model?.map((row) => (
+                <div key={`${row.model}/${row.collection}`} style={{ display: "grid", gridTemplateColumns: "200px 1fr", gap: 8 }}>
+                  <span className="muted">Embedded ({row.model}, {row.collection}):</span>
+                  <span>{row.embedded}/{stats.chunks_total ?? "?"}</span>
+                </div>
+              ))}
             </div>
           </div>
         </div>